@@ -2,12 +2,11 @@
 Wikipedia's Officeholder onebox.
 """
 
+import hashlib
 import re
-import us
-import yaml
 
-from bs4 import BeautifulSoup
-from lxml import etree
+# The parsers for each data source (yaml, lxml, bs4) and the state lookup
+# library (us) are slow to import, so they're imported where they're used.
 
 
 def normalize_field(field):
@@ -138,6 +137,8 @@ def normalize_location(state, district):
 
   normalized_district = number + suffix
 
+  import us
+
   # Check it's a valid state.
   normalized_state = ""
   full = us.states.lookup(unicode(unverified_state))
@@ -158,6 +159,8 @@ def new_from_yaml(filename):
   Yields:
     Candidates
   """
+  import yaml
+
   with open(filename) as stream:
     try:
       contents = yaml.load(stream)
@@ -184,6 +187,8 @@ def new_from_fec_xml(filename):
   Yields:
     (Candidate): candidates.
 """
+  from lxml import etree
+
   tree = etree.iterparse(filename)
 
   for _, elem in tree:
@@ -211,15 +216,58 @@ def new_from_fec_xml(filename):
       continue
     yield candidate
 
-def parse_candidates_column(candidates, citations):
+def index_citations(soup):
+  """Map every cite-note on a wikipedia page to its title and url.
+
+  Built once per page so that resolving a candidate's citation is a dict
+  lookup rather than a walk over the reference lists.
+
+    Args:
+      soup: (BeautifulSoup) a parsed wikipedia page
+    Returns:
+      {(str): (str, str), ...}: cite-note id, e.g., cite_note-68, to the
+                               citation's title and url
+  """
+  citations = {}
+  for ref_list in soup.findAll("ol", {"class": "references"}):
+    for ref in ref_list.findAll("li"):
+      link = ref.find("a", {"class": "external text"})
+      if link is not None:
+        citations[ref.get('id')] = (link.text, link.get('href'))
+  return citations
+
+
+def index_row_references(column):
+  """Map the reference links in a table cell to the cite-notes they point at.
+
+    Args:
+      column: (bs4.element.Tag) A table cell, e.g., the 'candidates' column.
+    Returns:
+      {(str): (str), ...}: link text, e.g., [63], to cite-note id, e.g.,
+                           cite_note-68
+  """
+  notes = {}
+  for ref in column.findAll("a"):
+    match = re.match("^#(.*)$", ref.get('href') or "")  # strip the leading '#'
+    if match is not None:
+      notes.setdefault(ref.text, match.group(1))
+    else:
+      notes.setdefault(ref.text, None)
+  return notes
+
+
+def parse_candidates_column(candidates, citations, notes=None):
   """Munges the 'candidates' column of a wikipedia table.
 
     Args:
       candidates: (str) A bunch of html including candidate names, page links
                   and citation references.
-      citations: {(str): (str), ...}
+      citations: {(str): (str, str), ...} The page's citation index, from
+                 index_citations.
+      notes: {(str): (str), ...} The cell's citation references, if already
+             known; otherwise they're found with index_row_references.
     Returns:
-      (str, str): Candidate name, citation
+      (str, (str, str)): Candidate name, citation title and url
   """
   other_parties = ["Green", "Independent", "Libertarian", "NPP", "PDP", "PIP",
                    "PPT", "R", "Reform", "Republican", "No Party Preference"]
@@ -256,57 +304,69 @@ def parse_candidates_column(candidates, citations):
     # 2. We get the A record that matches that reference. It looks like:
     #   <a href="#cite_note-68">[63]</a> The two numbers probably won't match,
     # btw.
-    # 3. Strip the pound sign off the cite-note and look it up in the list
-    # of citations we created above. That gives us a name, like "Candidate
-    # Does A Thing, Says Newspaper!" and a url. We save them both for now,
-    # and combine them in a reference-ish way when we create the wiki page.
-    refs = candidates.findAll("a")
-    citation = None
-    for ref in refs:
-      if ref.text == reference:  # That's that '[63]' mentioned above.
-        href = ref.get('href')   # e.g., #cite_note-68
-        match = re.match("^#(.*)$", href)  # strip the leading '#'
-        if match is not None:
-          note = match.group(1)
-          if note in citations:
-            citation = citations[note]
-        break
+    # 3. Look the cite-note up in the citation index for the page. That gives
+    # us a name, like "Candidate Does A Thing, Says Newspaper!" and a url. We
+    # save them both for now, and combine them in a reference-ish way when we
+    # create the wiki page.
+    if notes is None:
+      notes = index_row_references(candidates)
+    citation = citations.get(notes.get(reference))
   return name, citation
 
 
-def new_from_wikipedia_page(filename, office):
-  """Read a wikipedia Elections page and parse a list of candidates.
+def _read_wikipedia_page(filename, office):
+  """Parse a wikipedia Elections page and index its citations.
 
     Args:
       filename: (str) a file with one or more candidates
       office: (str) the name of the office to display (house|senate|governor)
-    Yields:
-      (Candidate): candidates.
+    Returns:
+      (BeautifulSoup, {(str): (str, str), ...}): the page and its citations.
   """
+  from bs4 import BeautifulSoup
+
   offices = ['house', 'senate', 'governor']
   if office not in offices:
     print "Warning: unexpected office, %s. Should be one of %s" % (
           office, offices)
 
   html = open(filename, 'r').read()
-  # We don't care about these. 'first_elected' is when the incumbent was
-  # elected, so is misleading.
-  skip_fields = ["pvi", "candidates", "first_elected"]
   soup = BeautifulSoup(html, 'html.parser')
-  citations = {}
-  for ref_lists in soup.findAll("ol", {"class": "references"}):
-    for ref in ref_lists.findAll("li"):
-      name = ref.get('id')
-      citation = ref.find("a", {"class": "external text"})
-      citations[name] = citation
+  return soup, index_citations(soup)
+
 
+def _wikipedia_rows(soup):
+  """Find the rows of a wikipedia Elections page that have candidates in them.
+
+    Args:
+      soup: (BeautifulSoup) a parsed wikipedia page
+    Yields:
+      (bs4.element.Tag, {(str): (bs4.element.Tag), ...}): each row, and its
+        cells indexed by column name, e.g., "candidates"
+  """
   tables = soup.findAll("table", {"class": "wikitable sortable"})
+  # Each table is a state or territory. Each row is a district, with its name
+  # in a <th> and the election information in <td>s.
+  return _candidate_rows(
+      [(row, row.findAll("th"), row.findAll("td"))
+       for row in table.findAll("tr")]
+      for table in tables)
 
-  for table in tables:  # each state/territory
+
+def _candidate_rows(tables):
+  """Find the table rows that have candidates in them.
+
+    Args:
+      tables: (iterable of [(row, [cell, ...], [cell, ...]), ...]) each
+              table's rows, with their header and data cells. Cells have the
+              text of the cell as .text.
+    Yields:
+      (row, {(str): (cell), ...}): each row, and its cells indexed by column
+        name, e.g., "candidates"
+  """
+  for table in tables:
     header_fields = []
-    for row in table.findAll("tr"):  # each district
-      headers = row.findAll("th")    # district name
-      columns = row.findAll("td")    # election information
+    for row, headers, columns in table:
       extracted = {}
       # Look for a top of table header with a "Candidates" column. Set headers
       # and move on.
@@ -341,31 +401,154 @@ def new_from_wikipedia_page(filename, office):
         print "Error: Unexpectedly empty candidates column for [%s]." % row
         continue
 
-      name, citation = parse_candidates_column(candidates, citations)
-      if not name:
-        continue
+      yield row, extracted
 
-      data = {}
-      data["name"] = name
-      data["office"] = office
-      data["party"] = "Democratic"
-
-      for k in extracted:
-        if k not in data and k not in skip_fields:
-          data[k] = extracted[k].text
-      if citation:
-        data["reference_name"] = citation.text
-        data["reference_url"] = citation.get('href')
-      else:
-        print "No citation for %s" % name
-      try:
-        candidate = make_candidate(data)
-      except CandidateException, ex:
-        print "Skipping %s candidate %s: %s" % (office, name, ex)
-        continue
+
+def _candidate_from_row(extracted, citations, office, notes=None):
+  """Make a Candidate from a row of a wikipedia Elections page.
+
+    Args:
+      extracted: ({(str): (bs4.element.Tag), ...}) the row's cells, indexed
+                 by column name, from _wikipedia_rows.
+      citations: {(str): (str, str), ...} The page's citation index.
+      office: (str) the name of the office to display (house|senate|governor)
+      notes: {(str): (str), ...} The candidates cell's citation references,
+             if already known.
+    Returns:
+      (Candidate): the row's Democratic candidate, or None.
+  """
+  # We don't care about these. 'first_elected' is when the incumbent was
+  # elected, so is misleading.
+  skip_fields = ["pvi", "candidates", "first_elected"]
+
+  name, citation = parse_candidates_column(extracted["candidates"], citations,
+                                           notes)
+  if not name:
+    return None
+
+  data = {}
+  data["name"] = name
+  data["office"] = office
+  data["party"] = "Democratic"
+
+  for k in extracted:
+    if k not in data and k not in skip_fields:
+      data[k] = extracted[k].text
+  if citation:
+    data["reference_name"], data["reference_url"] = citation
+  else:
+    print "No citation for %s" % name
+  try:
+    return make_candidate(data)
+  except CandidateException, ex:
+    print "Skipping %s candidate %s: %s" % (office, name, ex)
+    return None
+
+
+def new_from_wikipedia_page(filename, office):
+  """Read a wikipedia Elections page and parse a list of candidates.
+
+    Args:
+      filename: (str) a file with one or more candidates
+      office: (str) the name of the office to display (house|senate|governor)
+    Yields:
+      (Candidate): candidates.
+  """
+  soup, citations = _read_wikipedia_page(filename, office)
+  for _, extracted in _wikipedia_rows(soup):
+    candidate = _candidate_from_row(extracted, citations, office)
+    if candidate is not None:
+      yield candidate
+
+
+def new_from_wikitext(filename, office):
+  """Read a wikipedia Elections page's wikitext and parse a list of
+  candidates. Gets the same candidates as new_from_wikipedia_page does from
+  the rendered page.
+
+    Args:
+      filename: (str) a file of wikitext, e.g., from mediawiki.Wiki.get_wikitext
+      office: (str) the name of the office to display (house|senate|governor)
+    Yields:
+      (Candidate): candidates.
+  """
+  import wikitext
+
+  with open(filename, 'r') as wikifile:
+    text = wikifile.read().decode('utf-8')
+  tables, citations = wikitext.tables(text, "wikitable sortable")
+  for _, extracted in _candidate_rows(tables):
+    candidate = _candidate_from_row(extracted, citations, office,
+                                    extracted["candidates"].notes)
+    if candidate is not None:
       yield candidate
 
 
+def _row_hash(row, extracted, citations):
+  """Hash a row's markup, plus the citations it refers to, which live
+  elsewhere on the page and can change on their own."""
+  notes = index_row_references(extracted["candidates"])
+  cited = sorted(citations.get(note) for note in notes.values())
+  digest = hashlib.sha1(unicode(row).encode('utf-8'))
+  digest.update(repr(cited))
+  return digest.hexdigest()
+
+
+def diff_wikipedia_page(filename, office, previous):
+  """Read a wikipedia Elections page, only parsing rows that have changed.
+
+  Each row's markup is hashed. Rows with the same hash as last time reuse
+  last time's candidate data, so only new and changed rows go through
+  parse_candidates_column and make_candidate.
+
+    Args:
+      filename: (str) a file with one or more candidates
+      office: (str) the name of the office to display (house|senate|governor)
+      previous: ({(str): {"hash": (str), "data": {...}}, ...}) the rows from
+                the last time this page was read, or {} the first time.
+    Returns:
+      ([Candidate, ...], {(str): [{...}, ...]}, {(str): {...}, ...}): every
+        candidate on the page; candidate data that was "added", "changed"
+        or "removed" since last time; and the rows to pass as |previous| next
+        time.
+  """
+  soup, citations = _read_wikipedia_page(filename, office)
+  rows = {}
+  candidates = []
+  delta = {"added": [], "changed": [], "removed": []}
+
+  for row, extracted in _wikipedia_rows(soup):
+    # Rows are identified by their first column, e.g., the district.
+    key = row.find("th").text
+    while key in rows:
+      key += "+"
+    row_hash = _row_hash(row, extracted, citations)
+
+    old = previous.get(key)
+    if old is not None and old["hash"] == row_hash:
+      data = old["data"]
+    else:
+      candidate = _candidate_from_row(extracted, citations, office)
+      data = candidate.data() if candidate is not None else None
+      old_data = old["data"] if old is not None else None
+      if data is not None and old_data is None:
+        delta["added"].append(data)
+      elif data is None and old_data is not None:
+        delta["removed"].append(old_data)
+      elif data != old_data:
+        delta["changed"].append(data)
+
+    rows[key] = {"hash": row_hash, "data": data}
+    if data is not None:
+      candidates.append(Candidate(data["name"], dict(data)))
+
+  for key in previous:
+    if key not in rows and previous[key]["data"] is not None:
+      delta["removed"].append(previous[key]["data"])
+
+  return candidates, delta, rows
+
+
 class CandidateException(Exception):
   """Failed to create a candidate for some reasonable reason."""
   pass
@@ -390,23 +573,34 @@ def make_candidate(noisy_data):
       text = normalize_office(text)
     data[translated] = text
 
+  return _make_candidate(data, normalize_name, normalize_location)
+
+def _make_candidate(data, name_normalizer, location_normalizer):
+  """Validate translated candidate data and turn it into a Candidate.
+
+  Args:
+    data: ({str:str, ...}) Candidate data with field names and offices already
+          translated.
+    name_normalizer: (func) normalize_name, or something that behaves like it.
+    location_normalizer: (func) normalize_location, or something that behaves
+                         like it.
+  Returns:
+    (Candidate): a populated Candidate object
+  Raises:
+    CandidateException: missing name, office, district or state
+  """
   try:
-    name = normalize_name(data["name"])
+    name = name_normalizer(data["name"])
     data["name"] = name
     office = data["office"]
   except KeyError, ex:
     raise CandidateException("missing expected fields: %s" % ex)
 
-  if "district" in data:
-    district = data["district"]
-  else:
-    district = ""
-  if "state" in data:
-    state = data["state"]
-  else:
-    state = ""
+  # Empty elements in the fec xml, e.g., <can_off_dis/>, come through as None.
+  district = data.get("district") or ""
+  state = data.get("state") or ""
 
-  state, district = normalize_location(state, district)
+  state, district = location_normalizer(state, district)
 
   if not state:
     raise CandidateException("missing expected field: state. Had %s" %
@@ -417,11 +611,77 @@ def make_candidate(noisy_data):
   if not district:
     if office == "house":
       raise CandidateException("missing expected field: district")
+    data.pop("district", None)  # Rather than leave a None or "" behind.
   else:
     data["district"] = district
 
   return Candidate(name, data)
 
+def _memoized(func):
+  """Cache a normalizer's results, for data with lots of repeated values."""
+  cache = {}
+  def memoized_function(*args):
+    """Look up args, calling the wrapped normalizer the first time."""
+    try:
+      return cache[args]
+    except KeyError:
+      result = cache[args] = func(*args)
+      return result
+  return memoized_function
+
+# Marks a field that a row of make_candidates's columns doesn't have, as
+# opposed to one that's there but empty (None).
+MISSING = object()
+
+
+def make_candidates(columns):
+  """Turn columns of noisy candidate data into Candidates, in bulk.
+
+  Behaves like calling make_candidate on each row, but each distinct field
+  name, office, name and state/district pair is only normalized once. Columns
+  of FEC data are highly repetitive (there are only so many states, offices
+  and districts), so this is much cheaper for big datasets.
+
+  Args:
+    columns: ({str: [str, ...], ...}) Equal-length lists of candidate data,
+             indexed by type, e.g., {"can_nam": [...], "can_off": [...]}.
+             MISSING means the row doesn't have that field at all; None
+             means it's there but empty, like an empty element in the fec
+             xml, and is passed on just as make_candidate would.
+  Returns:
+    ([Candidate, ...], [(int, CandidateException), ...]): the candidates that
+      were created, and the row number and reason for every row that wasn't.
+  Raises:
+    ValueError: the columns are different lengths.
+  """
+  fields = [(normalize_field(tag), values) for tag, values in columns.items()]
+  lengths = set(len(values) for _, values in fields)
+  if len(lengths) > 1:
+    raise ValueError("columns have different lengths: %s" % sorted(lengths))
+  rows = lengths.pop() if lengths else 0
+
+  office_normalizer = _memoized(normalize_office)
+  name_normalizer = _memoized(normalize_name)
+  location_normalizer = _memoized(normalize_location)
+
+  candidates = []
+  rejected = []
+  for row in xrange(rows):
+    data = {}
+    for translated, values in fields:
+      text = values[row]
+      if text is MISSING:
+        continue
+      if translated == "office":
+        text = office_normalizer(text)
+      data[translated] = text
+    try:
+      candidates.append(
+          _make_candidate(data, name_normalizer, location_normalizer))
+    except CandidateException, ex:
+      rejected.append((row, ex))
+  return candidates, rejected
+
 class Candidate(object):
   """Name and a bunch of key/value pairs for a single candidate."""
   def __init__(self, name, data):
@@ -445,7 +705,11 @@ class Candidate(object):
   def wikipedia_content(self):
     """Create a wikipedia-formatted string of candidate information."""
     infostr = "{{Infobox Officeholder\n"
-    for k in self._data:
+    # In a fixed order, so the same data always makes the same page, however
+    # the dict was built.
+    ordered = [k for k in self.ordered_fields() if k in self._data]
+    ordered += sorted(k for k in self._data if k not in ordered)
+    for k in ordered:
       infostr += "| %s = %s\n" % (k, self._data[k])
 
     infostr += ("\n}}\n'''%s''' is a 2016 Democratic candidate seeking "
@@ -3,13 +3,21 @@
 """This script reads a list of candidates from various data sources and makes
 sure that they each have a wikipedia page, creating it if necessary"""
 
+import argparse
 import csv
-import getpass
+import json
+import os
 import sys
+import threading
+import time
 
 import candidate
-import credentials
-import mediawiki
+import checkpoint
+import export
+import schedule
+
+# credentials and mediawiki (which imports requests) are only imported when
+# we talk to the wiki, so that csv-only runs start quickly.
 
 #BASEURL = "https://test.wikipedia.org/w/"
 #BASEURL = "https://en.wikipedia.org/w/"
@@ -20,67 +28,1016 @@ YAML_FILE = "candidates.yaml"
 XML_FILE = "CandidateSummaryAction.xml"
 HOUSE_FILE = "house.html"
 GOVERNOR_FILE = "governor.html"
+CSV_FILE = "candidates.csv"
+# Where --fetch downloads each kind of source from.
+FEC_URL = "http://www.fec.gov/data/CandidateSummary.do?format=xml"
+WIKIPEDIA_URLS = {
+  "house": ("https://en.wikipedia.org/wiki/"
+            "United_States_House_of_Representatives_elections,_2016"),
+  "senate": "https://en.wikipedia.org/wiki/United_States_Senate_elections,_2016",
+  "governor": ("https://en.wikipedia.org/wiki/"
+               "United_States_gubernatorial_elections,_2016"),
+}
+# Where --fetch gets the wikitext of those pages, through the API.
+WIKIPEDIA_API_URL = "https://en.wikipedia.org/w/"
+# Offices that we can read wikipedia Elections pages for.
+WIKIPEDIA_OFFICES = ["house", "senate", "governor"]
+# Records what happened to each candidate, for --resume.
+JOURNAL_FILE = "candidatebot.journal"
+# The hash of what we last wrote to each page, for --update.
+PAGE_HASHES_FILE = "candidatebot.hashes.json"
+# The hash of each row of each wikipedia page, for --delta.
+ROW_STATE_FILE = "candidatebot.rows.json"
 # Limit what this does during testing.
 MAX_PAGES_TO_CREATE = 0
 
 
+def add_source_args(parser):
+  """Add flags for choosing data sources, for use with get_sources.
+
+  Args:
+    parser: (argparse.ArgumentParser) the parser to add them to.
+  """
+  parser.add_argument("--yaml", action="append", default=[], metavar="FILE",
+                      help="read candidates from a yaml file")
+  parser.add_argument("--fec", action="append", default=[], metavar="FILE",
+                      help="read candidates from an fec.gov xml file")
+  for office in WIKIPEDIA_OFFICES:
+    parser.add_argument("--%s" % office, action="append", default=[],
+                        metavar="FILE",
+                        help="read %s candidates from a wikipedia Elections "
+                             "page" % office)
+    parser.add_argument("--%s-wikitext" % office, action="append", default=[],
+                        metavar="FILE",
+                        help="read %s candidates from the wikitext of a "
+                             "wikipedia Elections page" % office)
+  parser.add_argument("--offices",
+                      help="only include candidates for these offices, "
+                           "comma separated, e.g., house,senate")
+
+
+def parse_args(argv):
+  """Parse command line flags.
+
+  Args:
+    argv: ([str, ...]) the command line arguments, without the program name.
+  Returns:
+    (argparse.Namespace): the parsed flags.
+  """
+  parser = argparse.ArgumentParser(description=__doc__)
+  add_source_args(parser)
+  parser.add_argument("--fetch", action="store_true",
+                      help="download the fec and wikipedia sources first, and "
+                           "stop if none of them have changed")
+  parser.add_argument("--delta", metavar="DELTA_FILE",
+                      help="only re-parse wikipedia table rows that changed "
+                           "since the last --delta run, and write the "
+                           "added, changed and removed candidates to "
+                           "DELTA_FILE")
+  parser.add_argument("--output", default=CSV_FILE,
+                      help="where to write the csv (default: %(default)s)")
+  parser.add_argument("--resume", action="store_true",
+                      help="skip candidates that an earlier, interrupted run "
+                           "already found or created pages for")
+  parser.add_argument("--journal", default=JOURNAL_FILE,
+                      help="where to record progress (default: %(default)s)")
+  parser.add_argument("--max-pages", type=int, default=MAX_PAGES_TO_CREATE,
+                      help="create no more than this many pages "
+                           "(default: %(default)s)")
+  mode = parser.add_mutually_exclusive_group()
+  mode.add_argument("--csv-only", action="store_true",
+                    help="just write the csv; don't talk to the wiki")
+  mode.add_argument("--export-xml", metavar="XML_FILE",
+                    help="don't talk to the wiki; write every candidate's "
+                         "page to XML_FILE for Special:Import")
+  mode.add_argument("--plan", metavar="PLAN_FILE",
+                    help="don't edit anything; write the pages that would be "
+                         "created, skipped or in conflict to PLAN_FILE")
+  mode.add_argument("--apply", metavar="PLAN_FILE",
+                    help="create the pages planned in PLAN_FILE by an "
+                         "earlier --plan run, without re-checking them")
+  mode.add_argument("--update", action="store_true",
+                    help="rewrite existing drafts whose content has changed, "
+                         "unless someone else has edited them")
+  parser.add_argument("--targets", metavar="NAMES",
+                      help="create or update pages on each of these wikis "
+                           "from the TARGETS in credentials.py, comma "
+                           "separated, at the same time")
+  parser.add_argument("--watch", action="store_true",
+                      help="keep running, and process sources again whenever "
+                           "they change")
+  parser.add_argument("--queue", metavar="QUEUE_FILE",
+                      help="queue candidates in QUEUE_FILE and create the "
+                           "most important pages first; whatever doesn't "
+                           "get created stays queued for the next run")
+  parser.add_argument("--priority", metavar="KEYS",
+                      default=",".join(schedule.DEFAULT_PRIORITY),
+                      help="how to order the --queue, most important first, "
+                           "from %s (default: %%(default)s)" % ", ".join(
+                               sorted(schedule.PRIORITY_KEYS)))
+  parser.add_argument("--window", metavar="MINUTES", type=float,
+                      help="stop creating pages from the --queue after this "
+                           "many minutes")
+  args = parser.parse_args(argv)
+  if args.watch and (args.export_xml or args.plan or args.apply or
+                     args.update):
+    parser.error("--watch only works with creating pages or --csv-only")
+  if args.targets and (args.csv_only or args.export_xml or args.plan or
+                       args.apply or args.watch):
+    parser.error("--targets only works with creating pages or --update")
+  if args.queue and (args.csv_only or args.export_xml or args.plan or
+                     args.apply or args.update or args.targets or args.watch):
+    parser.error("--queue only works with creating pages")
+  if (args.window is not None) and not args.queue:
+    parser.error("--window only works with --queue")
+  try:
+    schedule.make_priority(args.priority.split(","))
+  except ValueError, ex:
+    parser.error(str(ex))
+  return args
+
+
+def get_sources(args):
+  """Return the data sources to read, from the command line flags.
+
+  Args:
+    args: (argparse.Namespace) from parse_args.
+  Returns:
+    ([(str, str, str), ...]): Kind of source, filename and office (or None
+      if the source says which office each candidate is running for).
+  """
+  sources = []
+  for filename in args.yaml:
+    sources.append(("yaml", filename, None))
+  for filename in args.fec:
+    sources.append(("fec", filename, None))
+  for office in WIKIPEDIA_OFFICES:
+    for filename in getattr(args, office):
+      sources.append(("wikipedia", filename, office))
+    for filename in getattr(args, "%s_wikitext" % office):
+      sources.append(("wikitext", filename, office))
+  if not sources:
+    sources = [("wikipedia", HOUSE_FILE, "house"),
+               ("wikipedia", GOVERNOR_FILE, "governor")]
+  return sources
+
+
+def fetch_sources(sources):
+  """Download the latest version of each source that has a known url.
+
+  Args:
+    sources: ([(str, str, str), ...]) from get_sources.
+  Returns:
+    ([str, ...]): the files that changed, including every source without a
+      url, which we can't check.
+  """
+  import fetch
+
+  changed = []
+  for kind, filename, office in sources:
+    if kind == "fec":
+      url = FEC_URL
+    elif kind == "wikipedia":
+      url = WIKIPEDIA_URLS[office]
+    elif kind == "wikitext":
+      if fetch_wikitext(office, filename):
+        print "Downloaded %s" % filename
+        changed.append(filename)
+      else:
+        print "%s hasn't changed" % filename
+      continue
+    else:
+      # Nothing to download, so we can't tell; it might have changed.
+      changed.append(filename)
+      continue
+    try:
+      if fetch.fetch(url, filename):
+        print "Downloaded %s" % filename
+        changed.append(filename)
+      else:
+        print "%s hasn't changed" % filename
+    except fetch.FetchException, ex:
+      print "Error: %s" % ex
+      sys.exit(1)
+  return changed
+
+
+def fetch_wikitext(office, filename):
+  """Download the wikitext of an office's wikipedia Elections page, which is
+  much smaller than the rendered page.
+
+  Args:
+    office: (str) which page, from WIKIPEDIA_URLS.
+    filename: (str) where to save it.
+  Returns:
+    (bool): Whether the file changed.
+  """
+  import mediawiki
+  import requests
+
+  title = WIKIPEDIA_URLS[office].split("/wiki/", 1)[1]
+  try:
+    text = mediawiki.Wiki(WIKIPEDIA_API_URL, None, None).get_wikitext(title)
+  except (mediawiki.WikiException, requests.RequestException), ex:
+    print "Error: %s" % ex
+    sys.exit(1)
+  text = text.encode('utf-8')
+  if os.path.exists(filename):
+    with open(filename, 'rb') as wikifile:
+      if wikifile.read() == text:
+        return False
+  temporary = filename + ".tmp"
+  with open(temporary, 'wb') as out:
+    out.write(text)
+  os.rename(temporary, filename)
+  return True
+
+
+class RowChanges(object):
+  """Remembers the rows of each wikipedia page between runs, so that only
+  changed rows are parsed, and collects what changed."""
+
+  def __init__(self, delta_file, state_file=ROW_STATE_FILE):
+    """Load the rows from the last run.
+
+    Args:
+      delta_file: (str) where to write the changes.
+      state_file: (str) where rows are kept between runs.
+    """
+    self.delta_file = delta_file
+    self.state_file = state_file
+    self.rows = {}
+    if os.path.exists(state_file):
+      with open(state_file) as stream:
+        self.rows = json.load(stream)
+    self.delta = {"added": [], "changed": [], "removed": []}
+
+  def read_wikipedia_page(self, filename, office):
+    """Read a wikipedia page, re-parsing only rows that changed.
+
+    Args:
+      filename: (str) the file to read.
+      office: (str) the office the page is about.
+    Returns:
+      ([Candidate, ...]): every candidate on the page.
+    """
+    people, delta, rows = candidate.diff_wikipedia_page(
+        filename, office, self.rows.get(filename, {}))
+    self.rows[filename] = rows
+    for change in delta:
+      self.delta[change].extend(delta[change])
+    return people
+
+  def save(self):
+    """Write the changes, and the rows for next time, and start collecting
+    changes afresh."""
+    with open(self.delta_file, 'w') as stream:
+      json.dump(self.delta, stream, indent=2, sort_keys=True)
+    temporary = self.state_file + ".tmp"
+    with open(temporary, 'w') as stream:
+      json.dump(self.rows, stream)
+    os.rename(temporary, self.state_file)
+    print "%s added, %s changed and %s removed candidates in %s" % (
+        len(self.delta["added"]), len(self.delta["changed"]),
+        len(self.delta["removed"]), self.delta_file)
+    self.delta = {"added": [], "changed": [], "removed": []}
+
+
+def read_source(kind, filename, office, changes=None):
+  """Read one data source. Only the parser for that kind of source gets
+  imported.
+
+  Args:
+    kind: (str) yaml, fec, wikipedia or wikitext.
+    filename: (str) the file to read.
+    office: (str) the office a wikipedia page is about.
+    changes: (RowChanges) if given, wikipedia pages are read incrementally.
+  Returns:
+    (iterable): Candidates.
+  """
+  if kind == "yaml":
+    return candidate.new_from_yaml(filename)
+  if kind == "fec":
+    return candidate.new_from_fec_xml(filename)
+  if kind == "wikipedia":
+    if changes is not None:
+      return changes.read_wikipedia_page(filename, office)
+    return candidate.new_from_wikipedia_page(filename, office)
+  if kind == "wikitext":
+    return candidate.new_from_wikitext(filename, office)
+  raise ValueError("Unknown kind of source: %s" % kind)
+
+
+def read_candidates(sources, offices, writer, changes=None):
+  """Read candidates from data sources, writing each to the csv.
+
+  Args:
+    sources: ([(str, str, str), ...]) from get_sources.
+    offices: ([str, ...]) only include candidates for these offices, or None
+             for all of them.
+    writer: (csv.writer) where to write each candidate.
+    changes: (RowChanges) if given, wikipedia pages are read incrementally,
+             and the changes are saved once every source has been read.
+  Yields:
+    (Candidate): candidates.
+  """
+  for kind, filename, office in sources:
+    print "### %s" % filename
+    for person in read_source(kind, filename, office, changes):
+      if offices and person.data().get("office") not in offices:
+        continue
+      writer.writerow(person.as_list())
+      yield person
+  if changes is not None:
+    changes.save()
+
+
+def get_targets(names):
+  """Look up wikis to publish to in the TARGETS list in credentials.py.
+
+  Each target is a dictionary like
+    {"name": "staging", "url": "http://staging.example.com/w/",
+     "username": "Candidatebot", "password": "",
+     "draft_prefix": "User:Candidatebot/sandbox/",
+     "edits_per_second": 0.5, "queries_per_second": 5}
+  where everything but name, url and username is optional, and an empty
+  password is asked for.
+
+  Args:
+    names: ([str, ...]) which targets to use.
+  Returns:
+    ([{str: ...}, ...]): the targets.
+  """
+  import credentials
+
+  targets = dict((target["name"], target)
+                 for target in getattr(credentials, "TARGETS", []))
+  missing = [name for name in names if name not in targets]
+  if missing:
+    print ("Please add %s to the TARGETS list in credentials.py" %
+           ", ".join(missing))
+    sys.exit(1)
+  return [targets[name] for name in names]
+
+
+def connect_to_wiki(target=None):
+  """Log in to a wiki.
 
-def main():
-  """Gets a bunch of candidate information and tries to create pages for it."""
+  Args:
+    target: ({str: ...}) a wiki from get_targets. Defaults to BASEURL, with
+            the USERNAME and PASS from credentials.py.
+  Returns:
+    (mediawiki.Wiki): a logged-in wiki.
+  """
+  import getpass
+  import credentials
+  import mediawiki
 
-  if not credentials.USERNAME:
+  if target is None:
+    target = {"url": BASEURL, "username": credentials.USERNAME,
+              "password": credentials.PASS}
+
+  if not target.get("username"):
     print ("Please specify a user name in the variable USERNAME in a "
            "credentials.py file in the root directory")
     sys.exit(1)
-  if not credentials.PASS:
-    password = getpass.getpass("Password for wikipedia account %s: "
-                               % credentials.USERNAME)
+  if not target.get("password"):
+    password = getpass.getpass("Password for %s account %s: "
+                               % (target["url"], target["username"]))
   else:
-    password = credentials.PASS
+    password = target["password"]
 
   try:
-    wiki = mediawiki.Wiki(BASEURL, credentials.USERNAME, password,
-                          draft_prefix=DRAFT_PREFIX)
+    return mediawiki.Wiki(
+        target["url"], target["username"], password,
+        draft_prefix=target.get("draft_prefix", DRAFT_PREFIX),
+        edits_per_second=target.get("edits_per_second"),
+        queries_per_second=target.get("queries_per_second"))
   except mediawiki.WikiException, ex:
     print "Error: %s" % ex
     sys.exit(1)
 
-  created = 0
 
+def load_page_hashes(filename=PAGE_HASHES_FILE):
+  """Read the hashes of what we last wrote to each page.
 
-  csvfile = open('candidates.csv', 'wb')
-  writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
-  writer.writerow(candidate.Candidate.ordered_fields())
+  Args:
+    filename: (str) a file written by save_page_hashes.
+  Returns:
+    ({unicode: str, ...}): page title to the hex SHA-1 of its content.
+  """
+  if not os.path.exists(filename):
+    return {}
+  with open(filename) as hashfile:
+    return json.load(hashfile)
 
-  files = [(HOUSE_FILE, "house"),
-           (GOVERNOR_FILE, "governor")]
 
-  print "Creating no more than %s wiki pages." % MAX_PAGES_TO_CREATE
-  for filename, office in files:
-    print "### %s" % filename
-    # candidate.py also contains methods to parse yaml or XML.
-    for person in candidate.new_from_wikipedia_page(filename, office):
-      writer.writerow(person.as_list())
-      if created == MAX_PAGES_TO_CREATE:
-        continue
-      # Check if a live page exists.
-      existing_page = wiki.does_page_exist(person.name())
-      if existing_page:
-        print "Page already exists at %s" % existing_page
+def save_page_hashes(hashes, filename=PAGE_HASHES_FILE):
+  """Write the hashes of what we last wrote to each page.
+
+  Args:
+    hashes: ({unicode: str, ...}): page title to the hex SHA-1 of its content.
+    filename: (str) where to write them.
+  """
+  temporary = filename + ".tmp"
+  with open(temporary, 'w') as hashfile:
+    json.dump(hashes, hashfile, indent=2, sort_keys=True)
+  os.rename(temporary, filename)
+
+
+def _log(target, message):
+  """Print a message, prefixed with the name of the target wiki it's about.
+
+  Args:
+    target: (str) the target's name, or None for no prefix.
+    message: (str) what to print.
+  """
+  if target:
+    message = "%s: %s" % (target, message)
+  print message
+
+
+def update_drafts(wiki, people, page_hashes, max_pages, target=None):
+  """Rewrite existing drafts whose content would change.
+
+  One batch of queries fetches the current hash and author of every draft. A
+  draft is only edited if its content would change and it still has exactly
+  what we last wrote to it, so that we never overwrite anyone else's edits.
+  Drafts we have no record of writing (made before we kept hashes, or
+  imported from --export-xml) are taken on if we made their latest revision.
+
+  Args:
+    wiki: (mediawiki.Wiki) where the drafts are.
+    people: ([candidate.Candidate, ...]) candidates who might have drafts.
+    page_hashes: ({unicode: str, ...}) hashes of what we last wrote to each
+                 page, from load_page_hashes. Updated in place.
+    max_pages: (int) edit no more than this many pages.
+    target: (str) the name of the target wiki, to prefix messages with when
+            syncing several at once, or None.
+  Returns:
+    (int): how many pages were edited.
+  """
+  import mediawiki
+
+  titles = sorted(set(wiki.draft_title(person.name()) for person in people))
+  current = wiki.latest_revisions(titles)
+
+  updated = 0
+  _log(target, "Updating no more than %s wiki pages." % max_pages)
+  for person in people:
+    title = wiki.draft_title(person.name())
+    revision = current.get(title)
+    if revision is None:
+      continue  # No draft to update.
+    content = person.wikipedia_content()
+    new_hash = wiki.content_hash(content)
+    if revision["sha1"] == new_hash:
+      page_hashes[title] = new_hash
+      continue
+    if title not in page_hashes:
+      if not wiki.is_own_revision(revision):
+        _log(target, "Not updating %s: %s edited it last" % (
+            title, revision["user"]))
         continue
-      # Check for an existing draft page.
+    elif page_hashes[title] != revision["sha1"]:
+      _log(target,
+           "Not updating %s: it has been edited since we wrote it" % title)
+      continue
+    if updated == max_pages:
+      continue
+    _log(target, "Updating %s" % title)
+    try:
+      wiki.update_page_from_text(title, content)
+    except mediawiki.WikiException, ex:
+      _log(target, "Error updating %s: %s" % (title, ex))
+      continue
+    page_hashes[title] = new_hash
+    current[title] = {"sha1": new_hash, "user": wiki.username}
+    updated += 1
+  return updated
+
+
+def make_plan(wiki, people):
+  """Work out which pages need creating, with as few queries as possible.
+
+  Args:
+    wiki: (mediawiki.Wiki) where pages would be created.
+    people: ([candidate.Candidate, ...]) candidates who might need pages.
+  Returns:
+    ({str: ...}): The plan. Lists of pages to "create" (with their content),
+      "skip" because a live page or draft exists, and pages in "conflict"
+      because more than one candidate would get the same page.
+  """
+  titles = set()
+  for person in people:
+    titles.add(person.name())
+    titles.add(wiki.draft_title(person.name()))
+  existing = wiki.which_pages_exist(sorted(titles))
+
+  plan = {"wiki": wiki.url, "draft_prefix": wiki.draft_prefix,
+          "create": [], "skip": [], "conflict": []}
+  planned = {}
+  for person in people:
+    name = person.name()
+    entry = {"name": name, "title": wiki.draft_title(name),
+             "office": person.office_and_district()}
+    if name in planned:
+      entry["reason"] = "%s is also a candidate for %s" % (name, planned[name])
+      plan["conflict"].append(entry)
+      continue
+    planned[name] = person.office_and_district()
+
+    if existing.get(name):
+      entry["reason"] = "page exists"
+      entry["url"] = existing[name]
+      plan["skip"].append(entry)
+    elif existing.get(entry["title"]):
+      entry["reason"] = "draft exists"
+      entry["url"] = existing[entry["title"]]
+      plan["skip"].append(entry)
+    else:
+      entry["content"] = person.wikipedia_content()
+      plan["create"].append(entry)
+  return plan
+
+
+def apply_plan(wiki, plan, journal, page_hashes, max_pages):
+  """Create the pages in a plan from make_plan.
+
+  Args:
+    wiki: (mediawiki.Wiki) where to create pages. Must be the wiki and draft
+          prefix the plan was made for.
+    plan: ({str: ...}) a plan from make_plan.
+    journal: (checkpoint.Journal) where to record progress.
+    page_hashes: ({unicode: str, ...}) hashes of what we last wrote to each
+                 page. Updated in place.
+    max_pages: (int) create no more than this many pages.
+  Returns:
+    (int): how many pages were created.
+  """
+  import mediawiki
+
+  if (plan["wiki"] != wiki.url or
+      plan["draft_prefix"] != wiki.draft_prefix):
+    print "Error: plan was made for %s%s, not %s%s" % (
+        plan["wiki"], plan["draft_prefix"], wiki.url, wiki.draft_prefix)
+    sys.exit(1)
+
+  created = 0
+  print "Creating no more than %s of %s planned wiki pages." % (
+      max_pages, len(plan["create"]))
+  for entry in plan["create"]:
+    if created == max_pages:
+      break
+    if journal.is_done(entry["name"]):
+      continue
+    print "Creating %s (for %s)" % (entry["title"], entry["office"])
+    try:
+      new_page = wiki.create_page_from_text(entry["title"], entry["content"])
+    except mediawiki.WikiException, ex:
+      print "Error creating %s: %s" % (entry["title"], ex)
+      new_page = None
+    if new_page:
+      print "Created %s" % new_page
+      journal.record(entry["name"], checkpoint.CREATED)
+      page_hashes[entry["title"]] = wiki.content_hash(entry["content"])
+      created += 1
+    else:
+      print "Failed to create %s" % entry["title"]
+      journal.record(entry["name"], checkpoint.FAILED)
+  return created
+
+
+def create_page(wiki, person, journal, page_hashes, target=None):
+  """Create a draft for a candidate, unless they have a live page or a draft.
+
+  Errors talking to the wiki are logged and count as FAILED, rather than
+  raised, so that callers creating pages in a loop don't lose count of the
+  pages created before one fails.
+
+  Args:
+    wiki: (mediawiki.Wiki) where to create the page.
+    person: (candidate.Candidate) who might need a page.
+    journal: (checkpoint.Journal) where to record progress.
+    page_hashes: ({unicode: str, ...}) hashes of what we last wrote to each
+                 page. Updated in place.
+    target: (str) the name of the target wiki, to prefix messages with when
+            syncing several at once, or None.
+  Returns:
+    (str): what happened, one of checkpoint.EXISTS, CREATED or FAILED.
+  """
+  import mediawiki
+  import requests
+
+  try:
+    # Check if a live page exists.
+    existing_page = wiki.does_page_exist(person.name())
+    # Check for an existing draft page.
+    existing_draft = None
+    if not existing_page:
       existing_draft = wiki.does_draft_exist(person.name())
-      if existing_draft:
-        print "Draft already exists at %s" % existing_draft
+  except (mediawiki.WikiException, requests.RequestException), ex:
+    _log(target, "Error checking for a page for %s: %s" % (person.name(), ex))
+    journal.record(person.name(), checkpoint.FAILED)
+    return checkpoint.FAILED
+  if existing_page:
+    _log(target, "Page already exists at %s" % existing_page)
+    journal.record(person.name(), checkpoint.EXISTS)
+    return checkpoint.EXISTS
+  if existing_draft:
+    _log(target, "Draft already exists at %s" % existing_draft)
+    journal.record(person.name(), checkpoint.EXISTS)
+    return checkpoint.EXISTS
+  journal.record(person.name(), checkpoint.CHECKED)
+  _log(target, "Creating wikipedia page for %s (for %s)" % (
+      person.name(), person.office_and_district()))
+  content = person.wikipedia_content()
+  try:
+    new_page = wiki.create_page_from_text(
+        wiki.draft_title(person.name()), content)
+  except (mediawiki.WikiException, requests.RequestException), ex:
+    _log(target, "Error creating a page for %s: %s" % (person.name(), ex))
+    new_page = None
+  if new_page:
+    _log(target, "Created %s" % new_page)
+    journal.record(person.name(), checkpoint.CREATED)
+    page_hashes[wiki.draft_title(person.name())] = wiki.content_hash(content)
+    return checkpoint.CREATED
+  _log(target, "Failed to create a page for %s" % person.name())
+  journal.record(person.name(), checkpoint.FAILED)
+  return checkpoint.FAILED
+
+
+def create_pages(wiki, people, journal, page_hashes, max_pages,
+                 target=None):
+  """Create drafts for candidates who have neither a live page nor a draft.
+
+  Args:
+    wiki: (mediawiki.Wiki) where to create pages.
+    people: (iterable of candidate.Candidate) candidates who might need pages.
+    journal: (checkpoint.Journal) where to record progress.
+    page_hashes: ({unicode: str, ...}) hashes of what we last wrote to each
+                 page. Updated in place.
+    max_pages: (int) create no more than this many pages.
+    target: (str) the name of the target wiki, to prefix messages with when
+            syncing several at once, or None.
+  Returns:
+    (int): how many pages were created.
+  """
+  created = 0
+  _log(target, "Creating no more than %s wiki pages." % max_pages)
+  for person in people:
+    if created == max_pages:
+      continue
+    if journal.is_done(person.name()):
+      continue
+    state = create_page(wiki, person, journal, page_hashes, target)
+    if state == checkpoint.CREATED:
+      created += 1
+  return created
+
+
+def create_queued_pages(wiki, queue, journal, page_hashes, max_pages,
+                        deadline=None):
+  """Create drafts for the most important candidates in a queue first.
+
+  Candidates who get a page, or turn out to have one, are marked done in the
+  queue, so later runs don't queue them again. Anyone we couldn't create a
+  page for goes back in the queue for the next run, as does anyone we didn't
+  get to.
+
+  Args:
+    wiki: (mediawiki.Wiki) where to create pages.
+    queue: (schedule.EditQueue) candidates who might need pages.
+    journal: (checkpoint.Journal) where to record progress.
+    page_hashes: ({unicode: str, ...}) hashes of what we last wrote to each
+                 page. Updated in place.
+    max_pages: (int) create no more than this many pages.
+    deadline: (float) don't start on any more pages after this time, as from
+              time.time(), or None for no limit.
+  Returns:
+    (int): how many pages were created.
+  """
+  created = 0
+  retry = []
+  print "Creating no more than %s of %s queued wiki pages." % (
+      max_pages, len(queue))
+  try:
+    while created < max_pages:
+      if deadline is not None and time.time() >= deadline:
+        print "Out of time; %s pages are still queued." % len(queue)
+        break
+      person = queue.pop()
+      if person is None:
+        break
+      if journal.is_done(person.name()):
+        queue.mark_done(person.name())
         continue
-      print "Creating wikipedia page for %s (for %s)" % (
-        person.name(), person.office_and_district())
-      new_page = wiki.create_page(person, create_draft=True)
-      if new_page:
-        print "Created %s" % new_page
+      # Back in the queue if we're interrupted before finding out.
+      retry.append(person)
+      state = create_page(wiki, person, journal, page_hashes)
+      if state != checkpoint.FAILED:
+        retry.pop()
+        queue.mark_done(person.name())
+      if state == checkpoint.CREATED:
         created += 1
-      else:
-        print "Failed to create a page for %s" % person.name()
-      continue
+  finally:
+    for person in retry:
+      queue.push(person)
+  return created
+
+
+def create_from_queue(wiki, people, args):
+  """Add candidates to the --queue, then create pages from it, most important
+  first, within the page and time budgets. Candidates the queue has marked
+  done aren't added again.
+
+  Args:
+    wiki: (mediawiki.Wiki) where to create pages.
+    people: (iterable of candidate.Candidate) candidates to add to the queue.
+    args: (argparse.Namespace) from parse_args.
+  """
+  queue = schedule.EditQueue(
+      args.queue, schedule.make_priority(args.priority.split(",")))
+  for person in people:
+    queue.push(person)
+  deadline = None
+  if args.window is not None:
+    deadline = time.time() + args.window * 60
+  journal = checkpoint.Journal(args.journal, resume=args.resume)
+  page_hashes = load_page_hashes()
+  try:
+    create_queued_pages(wiki, queue, journal, page_hashes, args.max_pages,
+                        deadline)
+  finally:
+    journal.close()
+    save_page_hashes(page_hashes)
+    queue.save()
+    print "%s pages queued in %s" % (len(queue), args.queue)
+
+
+def sync_target(name, wiki, people, args):
+  """Create or update one target's pages. Each target keeps its own journal
+  and page hashes.
+
+  Args:
+    name: (str) the target's name.
+    wiki: (mediawiki.Wiki) the target.
+    people: ([candidate.Candidate, ...]) the candidates.
+    args: (argparse.Namespace) from parse_args.
+  """
+  hashes_file = "%s.%s" % (PAGE_HASHES_FILE, name)
+  page_hashes = load_page_hashes(hashes_file)
+  try:
+    if args.update:
+      updated = update_drafts(wiki, people, page_hashes, args.max_pages,
+                              name)
+      _log(name, "Updated %s pages" % updated)
+      return
+    journal = checkpoint.Journal("%s.%s" % (args.journal, name),
+                                 resume=args.resume)
+    try:
+      created = create_pages(wiki, people, journal, page_hashes,
+                             args.max_pages, name)
+      _log(name, "Created %s pages" % created)
+    finally:
+      journal.close()
+  finally:
+    save_page_hashes(page_hashes, hashes_file)
+
+
+def sync_targets(targets, people, args):
+  """Parse once, publish everywhere: sync several wikis at the same time.
+
+  Each target has its own login, draft prefix and rate budgets, so they
+  don't slow each other down. A target that fails doesn't stop the others,
+  but makes us exit with an error once they're done.
+
+  Args:
+    targets: ([{str: ...}, ...]) from get_targets.
+    people: ([candidate.Candidate, ...]) the candidates.
+    args: (argparse.Namespace) from parse_args.
+  """
+  # Log in one at a time, in case we have to ask for passwords.
+  wikis = [(target["name"], connect_to_wiki(target)) for target in targets]
+  failed = {}
+
+  def sync(name, wiki):
+    """Sync one target, noting if it fails."""
+    try:
+      sync_target(name, wiki, people, args)
+    except Exception, ex:  # pylint: disable=broad-except
+      _log(name, "Failed: %s: %s" % (type(ex).__name__, ex))
+      failed[name] = ex
+
+  threads = []
+  for name, wiki in wikis:
+    thread = threading.Thread(target=sync, name=name, args=(name, wiki))
+    thread.start()
+    threads.append(thread)
+  for thread in threads:
+    thread.join()
+  if failed:
+    print "Failed to sync %s" % ", ".join(
+        name for name, _ in wikis if name in failed)
+    sys.exit(1)
+
+
+def write_csv(filename, people):
+  """Write candidates to a csv file.
+
+  Args:
+    filename: (str) where to write them.
+    people: (iterable of candidate.Candidate) the candidates.
+  """
+  with open(filename, 'wb') as csvfile:
+    writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+    writer.writerow(candidate.Candidate.ordered_fields())
+    for person in people:
+      writer.writerow(person.as_list())
+
+
+def watch_sources(sources, offices, wiki, args):
+  """Process sources, then process each again whenever it changes, until
+  interrupted.
+
+  Candidates from unchanged sources, and the wiki login, are kept between
+  changes, so only the changed source is parsed and synced. A source that
+  can't be read keeps its last candidates, and a source that fails to sync
+  is tried again after the next change, so neither stops the watching.
+
+  Args:
+    sources: ([(str, str, str), ...]) from get_sources.
+    offices: ([str, ...]) only include candidates for these offices, or None
+             for all of them.
+    wiki: (mediawiki.Wiki) where to create pages, or None to only write the
+          csv.
+    args: (argparse.Namespace) from parse_args.
+  """
+  import mediawiki
+  import requests
+  import watch
+
+  changes = RowChanges(args.delta) if args.delta else None
+  journal = checkpoint.Journal(args.journal, resume=args.resume)
+  page_hashes = load_page_hashes()
+  watcher = watch.watcher_for([filename for _, filename, _ in sources])
+  people = dict((source, []) for source in sources)
+  created = 0
+  pending = sources
+  unsynced = []
+  try:
+    while True:
+      for source in pending:
+        kind, filename, office = source
+        print "### %s" % filename
+        try:
+          people[source] = [
+              person for person in read_source(kind, filename, office, changes)
+              if not offices or person.data().get("office") in offices]
+        except Exception, ex:  # pylint: disable=broad-except
+          # Each parser has its own errors, from modules we import lazily.
+          print "Error reading %s: %s: %s" % (
+              filename, type(ex).__name__, ex)
+      if changes is not None:
+        changes.save()
+      write_csv(args.output, [person for source in sources
+                              for person in people[source]])
+
+      if wiki is not None:
+        unsynced = []
+        for source in pending:
+          try:
+            created += create_pages(wiki, people[source], journal,
+                                    page_hashes, args.max_pages - created)
+          except (mediawiki.WikiException, requests.RequestException), ex:
+            print "Error syncing %s: %s: %s" % (
+                source[1], type(ex).__name__, ex)
+            unsynced.append(source)
+            continue
+          if [person for person in people[source]
+              if journal.state(person.name()) == checkpoint.FAILED]:
+            unsynced.append(source)
+        journal.sync()
+        save_page_hashes(page_hashes)
+
+      print "Waiting for sources to change..."
+      changed = watch.wait_for_changes(watcher)
+      pending = [source for source in sources
+                 if source[1] in changed or source in unsynced]
+  except KeyboardInterrupt:
+    pass
+  finally:
+    watcher.close()
+    journal.close()
+    save_page_hashes(page_hashes)
+
+
+def main(argv=None):
+  """Gets a bunch of candidate information and tries to create pages for it.
+
+  Args:
+    argv: ([str, ...]) command line arguments; defaults to sys.argv.
+  """
+  if argv is None:
+    argv = sys.argv[1:]
+  args = parse_args(argv)
+  sources = get_sources(args)
+  offices = args.offices.split(",") if args.offices else None
+
+  if args.apply:
+    with open(args.apply) as planfile:
+      plan = json.load(planfile)
+    wiki = connect_to_wiki()
+    journal = checkpoint.Journal(args.journal, resume=args.resume)
+    page_hashes = load_page_hashes()
+    try:
+      apply_plan(wiki, plan, journal, page_hashes, args.max_pages)
+    finally:
+      journal.close()
+      save_page_hashes(page_hashes)
+    return
+
+  if args.fetch and not fetch_sources(sources):
+    if not args.queue:
+      print "No sources have changed; nothing to do."
+      return
+    print "No sources have changed; creating queued pages."
+    create_from_queue(connect_to_wiki(), [], args)
+    return
+
+  if args.watch:
+    wiki = None if args.csv_only else connect_to_wiki()
+    watch_sources(sources, offices, wiki, args)
+    return
+
+  csvfile = open(args.output, 'wb')
+  writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+  writer.writerow(candidate.Candidate.ordered_fields())
+  changes = RowChanges(args.delta) if args.delta else None
+  people = read_candidates(sources, offices, writer, changes)
+
+  if args.csv_only:
+    for _ in people:
+      pass
+    csvfile.close()
+    return
+
+  if args.export_xml:
+    page_hashes = load_page_hashes()
+    with open(args.export_xml, 'wb') as out:
+      written = export.write_import_dump(people, out, DRAFT_PREFIX,
+                                         page_hashes)
+    save_page_hashes(page_hashes)
+    csvfile.close()
+    print "Wrote %s pages to %s" % (written, args.export_xml)
+    return
+
+  if args.targets:
+    people = list(people)
+    csvfile.close()
+    sync_targets(get_targets(args.targets.split(",")), people, args)
+    return
+
+  wiki = connect_to_wiki()
+
+  if args.plan or args.update:
+    people = list(people)
+    csvfile.close()
+
+  if args.update:
+    page_hashes = load_page_hashes()
+    try:
+      update_drafts(wiki, people, page_hashes, args.max_pages)
+    finally:
+      save_page_hashes(page_hashes)
+    return
+
+  if args.plan:
+    plan = make_plan(wiki, people)
+    with open(args.plan, 'w') as planfile:
+      json.dump(plan, planfile, indent=2, sort_keys=True)
+    print "Planned %s pages to create, %s to skip and %s conflicts in %s" % (
+        len(plan["create"]), len(plan["skip"]), len(plan["conflict"]),
+        args.plan)
+    return
+
+  if args.queue:
+    try:
+      create_from_queue(wiki, people, args)
+    finally:
+      csvfile.close()
+    return
+
+  journal = checkpoint.Journal(args.journal, resume=args.resume)
+  page_hashes = load_page_hashes()
+  try:
+    create_pages(wiki, people, journal, page_hashes, args.max_pages)
+  finally:
+    journal.close()
+    save_page_hashes(page_hashes)
+    csvfile.close()
+
 
-main()
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python2.7
+
+"""An append-only journal of what happened to each candidate, so that an
+interrupted run can pick up where it left off."""
+
+import os
+
+# What we know about a candidate's page.
+CHECKED = "checked"   # No live page or draft; about to create one.
+EXISTS = "exists"     # A live page or draft was already there.
+CREATED = "created"   # We created the draft.
+FAILED = "failed"     # We tried to create the draft and couldn't.
+STATES = [CHECKED, EXISTS, CREATED, FAILED]
+
+# States that a resumed run doesn't need to revisit.
+DONE = [EXISTS, CREATED]
+
+
+class Journal(object):
+  """Per-candidate processing state, backed by a file of 'state<TAB>name'
+  lines. Later lines win."""
+
+  def __init__(self, filename, resume=False, sync_every=20):
+    """Open the journal.
+
+    Args:
+      filename: (str) where the journal lives.
+      resume: (bool) Whether to keep the states from an earlier run. If not,
+              the journal is started afresh.
+      sync_every: (int) How many records to buffer before forcing them to
+                  disk. Losing the last few records in a crash just means a
+                  few redundant existence checks next time.
+    """
+    self.filename = filename
+    self.sync_every = sync_every
+    self._states = {}
+    self._unsynced = 0
+    if resume:
+      self._states = self.load(filename)
+      mode = 'a'
+    else:
+      mode = 'w'
+    self._file = open(filename, mode)
+    if resume and self._file.tell() > 0:
+      # Terminate any partly-written last line so new records start cleanly.
+      with open(filename, 'r') as journal:
+        journal.seek(-1, os.SEEK_END)
+        if journal.read(1) != "\n":
+          self._file.write("\n")
+
+  @staticmethod
+  def load(filename):
+    """Read a journal file.
+
+    Args:
+      filename: (str) a journal written by a previous run.
+    Returns:
+      ({unicode: str, ...}): The latest state for each candidate name.
+    """
+    states = {}
+    try:
+      journal = open(filename, 'r')
+    except IOError:
+      return states
+    with journal:
+      for line in journal:
+        # A crash can leave a partly-written last line; ignore it.
+        if not line.endswith("\n"):
+          break
+        try:
+          state, name = line[:-1].split("\t", 1)
+        except ValueError:
+          continue
+        if state in STATES:
+          states[name.decode('utf-8')] = state
+    return states
+
+  def state(self, name):
+    """Return the last recorded state for a candidate, or None."""
+    return self._states.get(name)
+
+  def is_done(self, name):
+    """Return whether nothing more needs to be done for a candidate."""
+    return self.state(name) in DONE
+
+  def record(self, name, state):
+    """Append a candidate's new state to the journal.
+
+    Args:
+      name: (unicode) the candidate's name.
+      state: (str) one of STATES.
+    """
+    if state not in STATES:
+      raise ValueError("Unknown journal state %s" % state)
+    self._states[name] = state
+    self._file.write("%s\t%s\n" % (state, name.encode('utf-8')))
+    self._unsynced += 1
+    if self._unsynced >= self.sync_every:
+      self.sync()
+
+  def sync(self):
+    """Force buffered records to disk."""
+    self._file.flush()
+    os.fsync(self._file.fileno())
+    self._unsynced = 0
+
+  def close(self):
+    """Sync and close the journal."""
+    if not self._file.closed:
+      self.sync()
+      self._file.close()
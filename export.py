@@ -0,0 +1,128 @@
+#!/usr/bin/python2.7
+
+"""Write candidate pages as a MediaWiki XML export, for loading into a wiki
+of our own with Special:Import or importDump.php instead of creating each page
+through the API."""
+
+import shutil
+import tempfile
+import time
+
+from xml.sax.saxutils import escape
+
+EXPORT_NAMESPACE = "http://www.mediawiki.org/xml/export-0.10/"
+USERNAME = "Candidatebot"
+SUMMARY = "candidatebot did this"
+# Lists every page in the export, like the one Wiki.create_page_from_text
+# appends to.
+LIST_OF_PAGES = "CandidatebotListOfPages"
+
+
+def _encode(text):
+  """Escape text for XML and encode it as utf-8."""
+  if not isinstance(text, unicode):
+    text = text.decode('utf-8')
+  return escape(text).encode('utf-8')
+
+
+class ImportDumpWriter(object):
+  """Streams <page> elements to a file, one at a time."""
+
+  def __init__(self, out, username=USERNAME):
+    """Start the dump.
+
+    Args:
+      out: (file) where to write the XML.
+      username: (str) who the revisions are attributed to.
+    """
+    self.out = out
+    self.username = username
+    self.timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    self.out.write('<mediawiki xmlns="%s" version="0.10" xml:lang="en">\n' %
+                   EXPORT_NAMESPACE)
+
+  def start_page(self, title):
+    """Start a page; its text follows with write_text.
+
+    Args:
+      title: (str) the full page name, including any prefix.
+    """
+    self.out.write(
+        "  <page>\n"
+        "    <title>%s</title>\n"
+        "    <revision>\n"
+        "      <timestamp>%s</timestamp>\n"
+        "      <contributor><username>%s</username></contributor>\n"
+        "      <comment>%s</comment>\n"
+        "      <model>wikitext</model>\n"
+        "      <format>text/x-wiki</format>\n"
+        '      <text xml:space="preserve">' % (
+            _encode(title), self.timestamp, _encode(self.username),
+            _encode(SUMMARY)))
+
+  def write_text(self, text):
+    """Write some of the current page's wikitext."""
+    self.out.write(_encode(text))
+
+  def end_page(self):
+    """Finish the current page."""
+    self.out.write("</text>\n"
+                   "    </revision>\n"
+                   "  </page>\n")
+
+  def write_page(self, title, content):
+    """Write one page.
+
+    Args:
+      title: (str) the full page name, including any prefix.
+      content: (str) wikitext.
+    """
+    self.start_page(title)
+    self.write_text(content)
+    self.end_page()
+
+  def close(self):
+    """Finish the dump."""
+    self.out.write("</mediawiki>\n")
+
+
+def write_import_dump(people, out, draft_prefix="", page_hashes=None):
+  """Write a page for each candidate, and a page listing them all.
+
+  Pages are written as they're read, and the list of pages is spooled to a
+  temporary file, so memory use doesn't grow with the number of candidates.
+
+  Args:
+    people: (iterable of candidate.Candidate) the candidates.
+    out: (file) where to write the XML.
+    draft_prefix: (str) Prepended to every page name.
+    page_hashes: ({unicode: str, ...}) If given, the hash of each page is
+                 recorded here, as for pages created through the API, so
+                 that --update can refresh the imported pages.
+  Returns:
+    (int): how many candidate pages were written.
+  """
+  if page_hashes is not None:
+    from mediawiki import Wiki
+
+  writer = ImportDumpWriter(out)
+  written = 0
+  with tempfile.TemporaryFile() as links:
+    for person in people:
+      title = "%s%s" % (draft_prefix, person.name())
+      # Importing keeps trailing whitespace that saving an edit would strip,
+      # so leave it off for the page's hash to match.
+      content = person.wikipedia_content().rstrip()
+      writer.write_page(title, content)
+      if page_hashes is not None:
+        page_hashes[title] = Wiki.content_hash(content)
+      # Already escaped, so it can be copied straight into the dump.
+      links.write(_encode(u"[[%s]]<br>" % title))
+      written += 1
+
+    writer.start_page(draft_prefix + LIST_OF_PAGES)
+    links.seek(0)
+    shutil.copyfileobj(links, out)
+    writer.end_page()
+  writer.close()
+  return written
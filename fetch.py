@@ -0,0 +1,88 @@
+#!/usr/bin/python2.7
+
+"""Download data sources, but only when they've changed since last time."""
+
+import hashlib
+import json
+import os
+
+import requests
+
+# Where to keep the ETag and Last-Modified headers of each download.
+CACHE_DIR = ".candidatebot-cache"
+USER_AGENT = "candidatebot (https://github.com/DevProgress/candidatebot)"
+# Give up on a server that takes longer than this to connect or to send the
+# next bit of the download.
+TIMEOUT_SECONDS = 60
+
+
+class FetchException(Exception):
+  """Failed to download something."""
+  pass
+
+
+def _metadata_file(url, cache_dir):
+  """Return where to keep the cache headers for a url."""
+  return os.path.join(cache_dir, hashlib.sha1(url).hexdigest() + ".json")
+
+
+def fetch(url, filename, cache_dir=CACHE_DIR, timeout=TIMEOUT_SECONDS):
+  """Download a url to a file, unless it hasn't changed since last time.
+
+  Sends the ETag and Last-Modified from the last download so that the server
+  can answer "304 Not Modified" instead of sending the whole thing again, and
+  asks for the response to be gzipped.
+
+  Args:
+    url: (str) what to download.
+    filename: (str) where to save it.
+    cache_dir: (str) where to keep the headers from the last download.
+    timeout: (float) seconds to wait for the server before giving up.
+  Returns:
+    (bool): Whether the file changed.
+  Raises:
+    FetchException: Couldn't download the url.
+  """
+  metadata_file = _metadata_file(url, cache_dir)
+  metadata = {}
+  if os.path.exists(filename) and os.path.exists(metadata_file):
+    with open(metadata_file) as stream:
+      metadata = json.load(stream)
+
+  headers = {"Accept-Encoding": "gzip", "User-Agent": USER_AGENT}
+  if metadata.get("etag"):
+    headers["If-None-Match"] = metadata["etag"]
+  if metadata.get("last_modified"):
+    headers["If-Modified-Since"] = metadata["last_modified"]
+
+  try:
+    req = requests.get(url, headers=headers, stream=True, timeout=timeout)
+  except requests.exceptions.RequestException, ex:
+    raise FetchException("Couldn't fetch %s: %s" % (url, ex))
+
+  if req.status_code == 304:
+    return False
+  if not req.ok:
+    raise FetchException("Got status code %s from %s: %s" % (
+        req.status_code, req.url, req.reason))
+
+  # Write somewhere else first so a failed download doesn't clobber the last
+  # good copy.
+  temporary = filename + ".tmp"
+  try:
+    with open(temporary, 'wb') as out:
+      # requests un-gzips as it goes.
+      for chunk in req.iter_content(chunk_size=65536):
+        out.write(chunk)
+  except (requests.exceptions.RequestException, IOError), ex:
+    if os.path.exists(temporary):
+      os.remove(temporary)
+    raise FetchException("Couldn't download %s: %s" % (url, ex))
+  os.rename(temporary, filename)
+
+  if not os.path.isdir(cache_dir):
+    os.makedirs(cache_dir)
+  with open(metadata_file, 'w') as stream:
+    json.dump({"url": url, "etag": req.headers.get("ETag"),
+               "last_modified": req.headers.get("Last-Modified")}, stream)
+  return True
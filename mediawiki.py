@@ -2,24 +2,107 @@
 
 """Methods for interacting with a mediawiki instance, like wikipedia."""
 
+import errno
+import hashlib
+import os
 import requests
 import time
 
+try:
+  import fcntl
+except ImportError:  # Not on Windows.
+  fcntl = None
+
 # Rate-limit aggressively. Can be increased if using against a test wiki. Should
 # stay cautious when used for wikipedia.
 EDIT_PAGES_PER_SECOND = 0.1
 QUERY_PAGES_PER_SECOND = 1
+# How many titles the API will look up in one query.
+TITLES_PER_QUERY = 50
+# Rate limits are shared, through lock files here, by every candidatebot
+# process this user runs. Set to None to rate-limit each process separately.
+RATE_LIMIT_DIR = os.path.join(os.path.expanduser("~"), ".candidatebot")
 
 # TODO: Set a user agent.
 
-def rate_limited(max_per_second):
+class SharedRateLimit(object):
+  """A rate limit that every process sharing a directory shares.
+
+  The file holds the time the budget was last used. The lock on it is only
+  held to check that time and, if the interval has passed, to record a new
+  one; waiting and the call itself happen outside the lock, so a slow or
+  hung call never holds anyone else up.
+  """
+
+  def __init__(self, budget, interval, directory):
+    """
+    Args:
+      budget: (str) Name of the budget, e.g., "edit".
+      interval: (float) Minimum number of seconds between uses.
+      directory: (str) Where to keep the lock file.
+    """
+    self.interval = interval
+    self.path = os.path.join(directory, "candidatebot-%s.ratelimit" % budget)
+    # Nobody else gets to plant files or links where we'll write.
+    try:
+      os.makedirs(directory, 0o700)
+    except OSError, ex:
+      if ex.errno != errno.EEXIST:
+        raise
+
+  def _try_claim(self):
+    """Use the budget now, if the interval has passed.
+
+    Returns:
+      (float): 0 if the budget was claimed; otherwise how many seconds until
+        it might be free.
+    """
+    fd = os.open(self.path,
+                 os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    try:
+      fcntl.flock(fd, fcntl.LOCK_EX)
+      try:
+        last_called = float(os.read(fd, 64) or 0)
+      except ValueError:
+        last_called = 0.0
+      now = time.time()
+      # A time in the future, e.g., from a changed clock, is bogus.
+      if last_called > now + self.interval:
+        last_called = 0.0
+      wait = last_called + self.interval - now
+      if wait > 0:
+        return min(wait, self.interval)
+      os.lseek(fd, 0, os.SEEK_SET)
+      os.ftruncate(fd, 0)
+      os.write(fd, repr(now))
+      return 0
+    finally:
+      os.close(fd)  # Which also unlocks it.
+
+  def __enter__(self):
+    while True:
+      wait = self._try_claim()
+      if not wait:
+        return self
+      time.sleep(wait)
+
+  def __exit__(self, *unused):
+    pass
+
+
+def rate_limited(max_per_second, budget=None):
   """Rate limiting decorator-with-args.
   Args:
     max_per_second: (float) How many times per second to do the thing.
+    budget: (str) If given, everything with the same budget shares the rate,
+            across all processes, using a SharedRateLimit in RATE_LIMIT_DIR.
+            When decorating methods, an object with a |rate_limit_key| gets a
+            budget of its own, and can change the rate with |rate_limits|,
+            e.g., {"edit": 0.5}.
   Returns:
     (func): A decorator
   """
-  interval = 1.0 / float(max_per_second)
+  default_interval = 1.0 / float(max_per_second)
 
   def decorator(func):
     """A rate-limiting decorator.
@@ -28,21 +111,57 @@ def rate_limited(max_per_second):
     Returns:
       (func): The rate-limting function to apply to the thing to wrap.
     """
-    last_called = [0.0]
+    last_called = {}
 
     def rate_limited_function(*args, **kwargs):
       """The actual rate limiting logic."""
-      elapsed = time.time() - last_called[0]
+      interval = default_interval
+      key = budget
+      if budget and args:
+        owner = args[0]
+        per_second = getattr(owner, "rate_limits", {}).get(budget)
+        if per_second:
+          interval = 1.0 / float(per_second)
+        if getattr(owner, "rate_limit_key", None):
+          key = "%s-%s" % (budget, owner.rate_limit_key)
+
+      if key and RATE_LIMIT_DIR and fcntl:
+        with SharedRateLimit(key, interval, RATE_LIMIT_DIR):
+          return func(*args, **kwargs)
+
+      elapsed = time.time() - last_called.get(key, 0.0)
       wait = interval - elapsed
       if wait > 0:
         time.sleep(wait)
       ret = func(*args, **kwargs)
-      last_called[0] = time.time()
+      last_called[key] = time.time()
       return ret
     return rate_limited_function
   return decorator
 
 
+def _asked_as(pages_to_query, query):
+  """Map the titles in a query's answer back to what we asked for.
+
+  The wiki answers with its own spelling of each title, e.g., with the first
+  letter capitalized, and answers once for titles that are spelled
+  differently but are the same page.
+
+  Args:
+    pages_to_query: ([str, ...]) the titles we asked about.
+    query: ({str: ...}) the "query" part of the answer.
+  Returns:
+    ({str: [str, ...], ...}): the wiki's spelling of each title to the
+      titles we asked about.
+  """
+  asked_as = {}
+  respelled = dict((normalized['from'], normalized['to'])
+                   for normalized in query.get('normalized', []))
+  for title in pages_to_query:
+    asked_as.setdefault(respelled.get(title, title), []).append(title)
+  return asked_as
+
+
 class WikiException(Exception):
   """Failed to log in to mediawiki."""
   pass
@@ -51,17 +170,31 @@ class WikiException(Exception):
 class Wiki(object):
   """Login credentials and methods for interacting with a mediawiki isntance."""
 
-  def __init__(self, url, username, password, draft_prefix="Draft:"):
+  def __init__(self, url, username, password, draft_prefix="Draft:",
+               edits_per_second=None, queries_per_second=None):
     """Log in to the wiki.
 
     Args:
       url: (str) url of the wiki
-      username: login for the wiki
+      username: login for the wiki, or None to only read from it
       password: password for the wiki
       draft_prefix: (str) How draft pages are named.
+      edits_per_second: (float) Edit rate, if not EDIT_PAGES_PER_SECOND.
+      queries_per_second: (float) Query rate, if not QUERY_PAGES_PER_SECOND.
     """
     self.url = url
-    self.login_cookies = self.get_login_cookies(username, password)
+    self.username = username
+    # Each wiki and account gets its own rate budgets.
+    self.rate_limit_key = hashlib.sha1(
+        (u"%s %s" % (url, username)).encode('utf-8')).hexdigest()[:12]
+    self.rate_limits = {}
+    if edits_per_second:
+      self.rate_limits["edit"] = edits_per_second
+    if queries_per_second:
+      self.rate_limits["query"] = queries_per_second
+    self.login_cookies = None
+    if username is not None:
+      self.login_cookies = self.get_login_cookies(username, password)
     self.draft_prefix = draft_prefix
 
   def get_login_cookies(self, username, password):
@@ -107,7 +240,7 @@ class Wiki(object):
 
     return req2.cookies
 
-  @rate_limited(QUERY_PAGES_PER_SECOND)
+  @rate_limited(QUERY_PAGES_PER_SECOND, budget="query")
   def does_page_exist(self, page_to_query):
     """Checks whether a page already exists.
     Args:
@@ -133,6 +266,156 @@ class Wiki(object):
       raise WikiException("Couldn't parse JSON:", ex)
 
 
+  def which_pages_exist(self, pages_to_query):
+    """Checks whether each of a list of pages exists, in as few queries as
+    the API allows.
+
+    Args:
+      pages_to_query: ([str, ...]) What to look up.
+    Returns:
+      ({str: str, ...}): For every page asked about, the page url if it exists;
+        None otherwise.
+    Raises:
+      WikiException: Bad data from the wiki.
+    """
+    existing = {}
+    for start in range(0, len(pages_to_query), TITLES_PER_QUERY):
+      batch = pages_to_query[start:start + TITLES_PER_QUERY]
+      existing.update(self._which_pages_exist(batch))
+    return existing
+
+  @rate_limited(QUERY_PAGES_PER_SECOND, budget="query")
+  def _which_pages_exist(self, pages_to_query):
+    """One query's worth of which_pages_exist."""
+    params = {'format': 'json', 'action': 'query', 'prop': 'info',
+              'inprop': 'url', 'titles': '|'.join(pages_to_query)}
+    req = requests.get(self.url + 'api.php', params=params)
+    if not req.ok:
+      raise WikiException("Got status code %s from %s: %s"% (
+                          req.status_code, req.url, req.reason))
+
+    try:
+      query = req.json()['query']
+    except (ValueError, KeyError), ex:
+      raise WikiException("Couldn't parse JSON:", ex)
+
+    asked_as = _asked_as(pages_to_query, query)
+    existing = dict((title, None) for title in pages_to_query)
+    for page in query.get('pages', {}).values():
+      if 'missing' in page or 'invalid' in page:
+        continue
+      for title in asked_as.get(page['title'], [page['title']]):
+        existing[title] = page['fullurl']
+    return existing
+
+  @rate_limited(QUERY_PAGES_PER_SECOND, budget="query")
+  def get_wikitext(self, title):
+    """Fetch a page's wikitext, without rendering it.
+
+    Args:
+      title: (str) the page.
+    Returns:
+      (unicode): the wikitext.
+    Raises:
+      WikiException: The page doesn't exist, or bad data from the wiki.
+    """
+    params = {'format': 'json', 'action': 'parse', 'prop': 'wikitext',
+              'page': title}
+    req = requests.get(self.url + 'api.php', params=params,
+                       cookies=self.login_cookies)
+    if not req.ok:
+      raise WikiException("Got status code %s from %s: %s"% (
+                          req.status_code, req.url, req.reason))
+
+    try:
+      response = req.json()
+    except ValueError, ex:
+      raise WikiException("Couldn't parse JSON:", ex)
+    if 'error' in response:
+      raise WikiException("Couldn't get the wikitext of %s: %s" % (
+          title, response['error'].get('info')))
+    try:
+      return response['parse']['wikitext']['*']
+    except KeyError, ex:
+      raise WikiException("Couldn't parse JSON:", ex)
+
+  def latest_revisions(self, pages_to_query):
+    """Fetch the SHA-1 and author of the current revision of each of a list
+    of pages, in as few queries as the API allows.
+
+    Args:
+      pages_to_query: ([str, ...]) What to look up.
+    Returns:
+      ({str: {str: str}, ...}): For every page asked about, the hex "sha1" of
+        its current text and the "user" who wrote it, if it exists; None
+        otherwise.
+    Raises:
+      WikiException: Bad data from the wiki.
+    """
+    revisions = {}
+    for start in range(0, len(pages_to_query), TITLES_PER_QUERY):
+      batch = pages_to_query[start:start + TITLES_PER_QUERY]
+      revisions.update(self._latest_revisions(batch))
+    return revisions
+
+  @rate_limited(QUERY_PAGES_PER_SECOND, budget="query")
+  def _latest_revisions(self, pages_to_query):
+    """One query's worth of latest_revisions."""
+    params = {'format': 'json', 'action': 'query', 'prop': 'revisions',
+              'rvprop': 'sha1|user', 'titles': '|'.join(pages_to_query)}
+    req = requests.get(self.url + 'api.php', params=params)
+    if not req.ok:
+      raise WikiException("Got status code %s from %s: %s"% (
+                          req.status_code, req.url, req.reason))
+
+    try:
+      query = req.json()['query']
+    except (ValueError, KeyError), ex:
+      raise WikiException("Couldn't parse JSON:", ex)
+
+    asked_as = _asked_as(pages_to_query, query)
+    latest = dict((title, None) for title in pages_to_query)
+    for page in query.get('pages', {}).values():
+      revisions = page.get('revisions')
+      if not revisions:
+        continue
+      for title in asked_as.get(page['title'], [page['title']]):
+        latest[title] = {'sha1': revisions[0].get('sha1'),
+                         'user': revisions[0].get('user')}
+    return latest
+
+  def is_own_revision(self, revision):
+    """Whether we wrote a revision.
+
+    Args:
+      revision: ({str: str}) from latest_revisions.
+    Returns:
+      (bool): whether the revision's author is the account we logged in as.
+    """
+    if not self.username or not revision.get('user'):
+      return False
+    # The wiki capitalizes usernames, and shows underscores as spaces.
+    username = self.username.replace("_", " ")
+    return revision['user'] == username[:1].upper() + username[1:]
+
+  @staticmethod
+  def content_hash(content):
+    """Return the SHA-1 the wiki will report for a page saved with content.
+
+    Args:
+      content: (unicode) wikitext
+    Returns:
+      (str) hex SHA-1, comparable with page_hashes.
+    """
+    # The wiki strips trailing whitespace when it saves a page.
+    if isinstance(content, unicode):
+      content = content.encode('utf-8')
+    return hashlib.sha1(content.rstrip()).hexdigest()
+
+  def draft_title(self, page):
+    """Return the name of the draft for a page."""
+    return "%s%s" % (self.draft_prefix, page)
+
   def does_draft_exist(self, page_to_query):
     """Checks whether a draft page exists.
     Args:
@@ -141,29 +424,17 @@ class Wiki(object):
     Returns:
       (str) the page url if it exists; None otherwise.
     """
-    draft_to_query = "%s%s" % (self.draft_prefix, page_to_query)
+    draft_to_query = self.draft_title(page_to_query)
     return self.does_page_exist(draft_to_query)
 
 
-  @rate_limited(EDIT_PAGES_PER_SECOND)
-  def create_page(self, person, create_draft=False):
-    """Create a page if it doesn't exist. If it already exists, just silently
-       does nothing.
-     Args:
-      person: (candidate.Candidate) data about one candidate
-      create_draft: (bool) Whether to create a draft page using the
-                    |self.draft_prefix| variable.
-     Returns:
-      (str) Url of page, whether newly created or already existing.
+  def get_edit_token(self):
+    """Return an edit token and the cookies to use it with.
+    Returns:
+      (str, requests.cookies.RequestsCookieJar): token and cookies.
     Raises:
-      WikiException: Couldn't create the page. The page already existing does
-        not raise an exception.
+      WikiException: Couldn't get a token.
     """
-    if create_draft:
-      page_to_edit = "%s%s" % (self.draft_prefix, person.name())
-    else:
-      page_to_edit = person.name()
-
     params = '?format=json&action=query&meta=tokens&continue='
     req = requests.get(self.url + 'api.php' + params,
                        cookies=self.login_cookies)
@@ -179,8 +450,42 @@ class Wiki(object):
 
     edit_cookie = self.login_cookies.copy()
     edit_cookie.update(req.cookies)
+    return edit_token, edit_cookie
 
-    content_to_write = person.wikipedia_content()
+  def create_page(self, person, create_draft=False):
+    """Create a page if it doesn't exist. If it already exists, just silently
+       does nothing.
+     Args:
+      person: (candidate.Candidate) data about one candidate
+      create_draft: (bool) Whether to create a draft page using the
+                    |self.draft_prefix| variable.
+     Returns:
+      (str) Url of page, whether newly created or already existing.
+    Raises:
+      WikiException: Couldn't create the page. The page already existing does
+        not raise an exception.
+    """
+    if create_draft:
+      page_to_edit = self.draft_title(person.name())
+    else:
+      page_to_edit = person.name()
+
+    return self.create_page_from_text(page_to_edit, person.wikipedia_content())
+
+  @rate_limited(EDIT_PAGES_PER_SECOND, budget="edit")
+  def create_page_from_text(self, page_to_edit, content_to_write):
+    """Create a page with the given wikitext, and add it to the list of pages
+       we've created.
+     Args:
+      page_to_edit: (str) the full name of the page, including any prefix.
+      content_to_write: (str) wikitext, e.g., from Candidate.wikipedia_content
+     Returns:
+      (str) Url of page, whether newly created or already existing.
+    Raises:
+      WikiException: Couldn't create the page. The page already existing does
+        not raise an exception.
+    """
+    edit_token, edit_cookie = self.get_edit_token()
 
     payload = {'action': 'edit', 'assert': 'user', 'format': 'json', 'utf8': '',
                'text': content_to_write, 'summary': 'candidatebot did this',
@@ -202,7 +507,7 @@ class Wiki(object):
 
     # Add to the list of stubs we've created.
     link = "[[%s]]<br>" % page_to_edit
-    list_page = "%s%s" % (self.draft_prefix, "CandidatebotListOfPages")
+    list_page = self.draft_title("CandidatebotListOfPages")
 
     payload = {'action': 'edit', 'assert': 'user', 'format': 'json',
                'utf8': '', 'appendtext': link,
@@ -212,3 +517,27 @@ class Wiki(object):
                         cookies=edit_cookie)
 
     return created_page
+
+  @rate_limited(EDIT_PAGES_PER_SECOND, budget="edit")
+  def update_page_from_text(self, page_to_edit, content_to_write):
+    """Replace the text of an existing page.
+     Args:
+      page_to_edit: (str) the full name of the page, including any prefix.
+      content_to_write: (str) wikitext, e.g., from Candidate.wikipedia_content
+    Raises:
+      WikiException: Couldn't edit the page, e.g., because it doesn't exist.
+    """
+    edit_token, edit_cookie = self.get_edit_token()
+
+    payload = {'action': 'edit', 'assert': 'user', 'format': 'json', 'utf8': '',
+               'text': content_to_write, 'summary': 'candidatebot did this',
+               'title': page_to_edit, 'token': edit_token, 'nocreate': True}
+    req = requests.post(self.url + 'api.php', data=payload, cookies=edit_cookie)
+
+    if not req.ok:
+      raise WikiException("Got status code %s from %s: %s"% (
+              req.status_code, req.url, req.reason))
+
+    if (req.text.find('"result":"Failure"') > -1 or
+        req.text.find('"error":') > -1):
+      raise WikiException("Saw error in edit response: %s" % req.text)
@@ -0,0 +1,208 @@
+#!/usr/bin/python2.7
+
+"""A queue of pages waiting to be created, most valuable first.
+
+Edits are slow and rationed, so rather than creating pages in the order the
+sources list them, candidates are queued with a priority and the queue is
+drained best first. The queue is kept in a file between runs, so whatever
+didn't fit in one run's budget is first in line for the next.
+"""
+
+import heapq
+import json
+import os
+import re
+
+import candidate
+
+# Lower sorts first.
+OFFICE_PRIORITY = {"senate": 0, "governor": 1, "house": 2}
+# Fields that hold the name of whoever holds the office now.
+INCUMBENT_FIELDS = ["representative", "senator", "governor", "incumbent"]
+# What the "status" column says when the sitting officeholder is running again.
+INCUMBENT_RUNNING_RE = re.compile(r"^(incumbent )?running$", re.IGNORECASE)
+
+
+def _office(data):
+  """Senate, then governor, then house races."""
+  return OFFICE_PRIORITY.get(data.get("office"), len(OFFICE_PRIORITY))
+
+
+def _open_seat(data):
+  """Open seats, then races we don't know about, then seats where the
+  incumbent is running again."""
+  status = data.get("status")
+  if not status:
+    return 1
+  if INCUMBENT_RUNNING_RE.match(status.strip()):
+    return 2
+  return 0
+
+
+def _incumbent(data):
+  """Challengers before sitting officeholders, who usually have a page."""
+  for field in INCUMBENT_FIELDS:
+    if data.get(field) and data.get(field) == data.get("name"):
+      return 1
+  return 0
+
+
+def _citation(data):
+  """Candidates with a citation, whose pages will have a reference."""
+  return 0 if data.get("reference_url") else 1
+
+
+def _state(data):
+  """Alphabetically by state."""
+  return data.get("state", "")
+
+
+PRIORITY_KEYS = {
+  "office": _office,
+  "open_seat": _open_seat,
+  "incumbent": _incumbent,
+  "citation": _citation,
+  "state": _state,
+}
+DEFAULT_PRIORITY = ["office", "open_seat", "incumbent", "citation", "state"]
+
+
+def make_priority(keys=None):
+  """Build a priority function that sorts by several keys in turn.
+
+  Args:
+    keys: ([str, ...]) names from PRIORITY_KEYS, most important first.
+          Defaults to DEFAULT_PRIORITY.
+  Returns:
+    (function): takes a candidate's data and returns something sortable;
+      lower is more important.
+  Raises:
+    ValueError: a key isn't in PRIORITY_KEYS.
+  """
+  keys = DEFAULT_PRIORITY if keys is None else keys
+  unknown = [key for key in keys if key not in PRIORITY_KEYS]
+  if unknown:
+    raise ValueError("Unknown priorities: %s (expected some of %s)" % (
+        ", ".join(unknown), ", ".join(sorted(PRIORITY_KEYS))))
+  functions = [PRIORITY_KEYS[key] for key in keys]
+  return lambda data: tuple(function(data) for function in functions)
+
+
+class EditQueue(object):
+  """Candidates waiting for pages, popped in priority order.
+
+  Each candidate is queued at most once; pushing a candidate who's already
+  queued replaces their data. Candidates pushed with the same priority come
+  out in the order they were first pushed. Candidates marked done are
+  remembered, and pushing them again does nothing, so a run that pushes
+  everyone from the sources only queues who's left.
+  """
+
+  def __init__(self, filename=None, priority=None):
+    """Open the queue, picking up anything left from an earlier run.
+
+    Args:
+      filename: (str) where the queue is kept between runs, or None to keep
+                it in memory only.
+      priority: (function) takes a candidate's data and returns something
+                sortable, lower first. Defaults to make_priority().
+    """
+    self.filename = filename
+    self.priority = priority or make_priority()
+    self._entries = {}  # name to (sequence number, data)
+    self._heap = []  # (priority, sequence number, name)
+    self._next = 0
+    self._done = set()
+    if filename and os.path.exists(filename):
+      with open(filename) as queuefile:
+        saved = json.load(queuefile)
+      self._done.update(saved["done"])
+      for name, data in saved["queued"]:
+        self._add(name, data)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, name):
+    return name in self._entries
+
+  def _add(self, name, data):
+    """Queue a candidate, keeping their place if they're already queued."""
+    if name in self._entries:
+      sequence = self._entries[name][0]
+    else:
+      sequence = self._next
+      self._next += 1
+    self._entries[name] = (sequence, data)
+    # Any older heap entry for this name is skipped when it's popped.
+    heapq.heappush(self._heap, (self.priority(data), sequence, name))
+
+  def push(self, person):
+    """Queue a candidate, unless they're done.
+
+    Args:
+      person: (candidate.Candidate) who might need a page.
+    Returns:
+      (bool): whether they were queued.
+    """
+    if person.name() in self._done:
+      return False
+    self._add(person.name(), person.data())
+    return True
+
+  def mark_done(self, name):
+    """Note that a candidate has a page, so they're never queued again.
+
+    Args:
+      name: (unicode) the candidate's name.
+    """
+    self._done.add(name)
+    self._entries.pop(name, None)
+
+  def is_done(self, name):
+    """Whether a candidate has been marked done.
+
+    Args:
+      name: (unicode) the candidate's name.
+    Returns:
+      (bool): whether they're done.
+    """
+    return name in self._done
+
+  def pop(self):
+    """Remove and return the most important candidate.
+
+    Returns:
+      (candidate.Candidate): the candidate, or None if the queue is empty.
+    """
+    while self._heap:
+      priority, sequence, name = heapq.heappop(self._heap)
+      entry = self._entries.get(name)
+      if entry is None or entry[0] != sequence:
+        continue
+      if self.priority(entry[1]) != priority:
+        continue  # Pushed again with different data; a newer entry exists.
+      del self._entries[name]
+      return candidate.Candidate(name, entry[1])
+    return None
+
+  def save(self):
+    """Write the queue, in priority order, and who's done to its file.
+
+    Written to a temporary file and renamed, so a crash can't leave half a
+    queue behind.
+    """
+    if not self.filename:
+      return
+
+    def order(entry):
+      """By priority, then the order they were pushed."""
+      _, (sequence, data) = entry
+      return self.priority(data), sequence
+
+    entries = sorted(self._entries.items(), key=order)
+    temporary = self.filename + ".tmp"
+    with open(temporary, 'w') as queuefile:
+      json.dump({"queued": [[name, data] for name, (_, data) in entries],
+                 "done": sorted(self._done)}, queuefile, indent=1)
+    os.rename(temporary, self.filename)
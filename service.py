@@ -0,0 +1,267 @@
+#!/usr/bin/python2.7
+
+"""A read-only HTTP service for looking up candidates.
+
+Candidates are read from the same data sources as candidatebot.py and kept
+in memory, indexed by state, office, state and district, and name. Sources are
+re-read in the background when they change.
+
+  ./service.py --house house.html --port 8080
+  curl 'http://localhost:8080/candidates?state=AL&office=house&district=2'
+"""
+
+import argparse
+import bisect
+import BaseHTTPServer
+import json
+import os
+import re
+import SocketServer
+import sys
+import threading
+import urlparse
+
+import candidate
+import candidatebot
+
+PORT = 8080
+# How often to check whether the data sources have changed.
+RELOAD_CHECK_SECONDS = 5
+
+
+def normalize_for_search(name):
+  """Lowercase a name and collapse its whitespace, for prefix matching."""
+  return " ".join(name.lower().split())
+
+
+class CandidateIndex(object):
+  """An immutable set of candidates with indexes for fast lookups."""
+
+  def __init__(self, people):
+    """Index some candidates.
+
+    Args:
+      people: (iterable of candidate.Candidate) the candidates to index.
+    """
+    self._data = []
+    self._by_state = {}
+    self._by_office = {}
+    self._by_district = {}
+    names = set()
+    for person in people:
+      data = person.data()
+      position = len(self._data)
+      self._data.append(data)
+      self._by_state.setdefault(data.get("state"), []).append(position)
+      self._by_office.setdefault(data.get("office"), []).append(position)
+      self._by_district.setdefault(
+          (data.get("state"), data.get("district")), []).append(position)
+      # Index every word onwards, so "catface" and "alex catface" both find
+      # Alex Catface.
+      words = normalize_for_search(person.name()).split(" ")
+      for i in range(len(words)):
+        names.add((" ".join(words[i:]), position))
+    self._names = sorted(names)
+
+  def __len__(self):
+    return len(self._data)
+
+  def _name_matches(self, prefix):
+    """Return the positions of candidates with a name matching a prefix."""
+    prefix = normalize_for_search(prefix)
+    matches = set()
+    start = bisect.bisect_left(self._names, (prefix,))
+    for name, position in self._names[start:]:
+      if not name.startswith(prefix):
+        break
+      matches.add(position)
+    return matches
+
+  def lookup(self, state=None, office=None, district=None, name=None):
+    """Find candidates matching all of the given criteria.
+
+    Args:
+      state: (str) a state name or abbreviation, e.g., "AL"
+      office: (str) house|senate|governor
+      district: (str) a district, e.g., "2", "02", "2nd" or "at-large". Only
+                used along with state; a district we can't make sense of
+                matches nobody.
+      name: (str) a prefix of the candidate's name or surname.
+    Returns:
+      ([{str: str, ...}, ...]): data for each matching candidate.
+    """
+    candidate_sets = []
+    if state is not None:
+      # normalize_location understands "Alaska 2" or "Alaska at-large", but
+      # not "2nd", and only drops leading zeros from a bare number.
+      wanted = district
+      if district:
+        district = re.sub(r"^(\d+)(st|nd|rd|th)$", r"\1", district.strip())
+        district = re.sub(r"^0+(\d)", r"\1", district)
+        district = "%s %s" % (state, district)
+      state, district = candidate.normalize_location(state, district or "")
+      if district:
+        candidate_sets.append(self._by_district.get((state, district), []))
+      elif wanted:
+        return []  # Rather than every candidate in the state.
+      else:
+        candidate_sets.append(self._by_state.get(state, []))
+    if office is not None:
+      candidate_sets.append(self._by_office.get(office, []))
+    if name is not None:
+      candidate_sets.append(self._name_matches(name))
+
+    if not candidate_sets:
+      return list(self._data)
+    # Intersect the smallest set with the others.
+    candidate_sets.sort(key=len)
+    positions = set(candidate_sets[0])
+    for other in candidate_sets[1:]:
+      positions.intersection_update(other)
+    return [self._data[position] for position in sorted(positions)]
+
+
+def load_index(sources, offices=None):
+  """Read data sources into a CandidateIndex.
+
+  Args:
+    sources: ([(str, str, str), ...]) from candidatebot.get_sources.
+    offices: ([str, ...]) only include candidates for these offices, or None
+             for all of them.
+  Returns:
+    (CandidateIndex): the candidates.
+  """
+  people = []
+  for kind, filename, office in sources:
+    for person in candidatebot.read_source(kind, filename, office):
+      if offices and person.data().get("office") not in offices:
+        continue
+      people.append(person)
+  return CandidateIndex(people)
+
+
+class CandidateStore(object):
+  """Holds the current CandidateIndex and replaces it when sources change.
+
+  Readers just use |index|; a reload builds a complete new index before
+  swapping it in, so they never wait and never see a partial one.
+  """
+
+  def __init__(self, sources, offices=None):
+    self.sources = sources
+    self.offices = offices
+    self._mtimes = self._source_mtimes()
+    self.index = load_index(sources, offices)
+
+  def _source_mtimes(self):
+    """Return the modification time of each source file."""
+    mtimes = {}
+    for _, filename, _ in self.sources:
+      try:
+        mtimes[filename] = os.stat(filename).st_mtime
+      except OSError:
+        mtimes[filename] = None
+    return mtimes
+
+  def reload_if_changed(self):
+    """Re-read the sources if any have changed.
+
+    If they can't be read, e.g., because one is half-written or malformed,
+    the old index is kept, and they're tried again when they next change.
+
+    Returns:
+      (bool): whether the index was replaced.
+    """
+    mtimes = self._source_mtimes()
+    if mtimes == self._mtimes:
+      return False
+    self._mtimes = mtimes
+    try:
+      index = load_index(self.sources, self.offices)
+    # Each kind of source fails in its own way (yaml, lxml, bs4, or plain
+    # KeyErrors on surprising data), and none of them should stop the
+    # service.
+    except Exception, ex:  # pylint: disable=broad-except
+      print "Not reloading candidates: %s: %s" % (type(ex).__name__, ex)
+      return False
+    self.index = index
+    print "Reloaded %s candidates" % len(index)
+    return True
+
+  def watch(self, interval=RELOAD_CHECK_SECONDS):
+    """Check for changes every |interval| seconds, in a background thread."""
+    stopped = threading.Event()
+
+    def check():
+      """Reload until stopped."""
+      while not stopped.wait(interval):
+        try:
+          self.reload_if_changed()
+        except Exception, ex:  # pylint: disable=broad-except
+          print "Error checking for changed candidates: %s" % ex
+
+    thread = threading.Thread(target=check, name="reloader")
+    thread.daemon = True
+    thread.start()
+    return stopped
+
+
+class CandidateHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Serves /candidates?state=&office=&district=&name= as JSON."""
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    """Handle a lookup."""
+    url = urlparse.urlparse(self.path)
+    if url.path != "/candidates":
+      self.send_error(404)
+      return
+    query = urlparse.parse_qs(url.query)
+    criteria = {}
+    for field in ["state", "office", "district", "name"]:
+      if field in query:
+        criteria[field] = query[field][0].decode('utf-8')
+
+    results = self.server.store.index.lookup(**criteria)
+    body = json.dumps(results)
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json; charset=utf-8")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    """Don't log every request."""
+    pass
+
+
+class CandidateServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  """A threaded HTTP server with a CandidateStore."""
+  daemon_threads = True
+
+  def __init__(self, address, store):
+    BaseHTTPServer.HTTPServer.__init__(self, address, CandidateHandler)
+    self.store = store
+
+
+def main(argv=None):
+  """Load candidates and serve them until interrupted."""
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+  candidatebot.add_source_args(parser)
+  parser.add_argument("--port", type=int, default=PORT,
+                      help="port to listen on (default: %(default)s)")
+  args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+  offices = args.offices.split(",") if args.offices else None
+  store = CandidateStore(candidatebot.get_sources(args), offices)
+  store.watch()
+  server = CandidateServer(("localhost", args.port), store)
+  print "Serving %s candidates on http://localhost:%s/candidates" % (
+      len(store.index), args.port)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+
+
+if __name__ == "__main__":
+  main()
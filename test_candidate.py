@@ -1,7 +1,14 @@
 #!/usr/bin/python2.7
 """Tests for candidate.py. Run them with py.test."""
 
+import collections
+import json
+import os
 import re
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
 import candidate
@@ -69,6 +76,45 @@ class TestCandidate(unittest.TestCase):
       except candidate.CandidateException:
         pass
 
+  def test_bulk_candidate_creation(self):
+    """Test that column-wise creation matches one-at-a-time creation."""
+    missing = candidate.MISSING
+    columns = {
+      "can_nam": ["PERSON, SOME", "PERSON, SOME", "CATFACE, ALEX",
+                  "BEAR, P III", missing, "BANANA, MABEL", "SOFA, LUCY"],
+      "can_off": ["H", "H", "S", "H", "S", "S", "H"],
+      "can_off_sta": ["NM", "NM", "AL", "NM", "AL", "AL", "AL"],
+      # Empty elements, like <can_off_dis/>, are None.
+      "can_off_dis": ["01", "01", missing, missing, missing, None, None],
+      "can_par_aff": ["DEM", "DEM", "DEM", "DEM", "DEM", "DEM", "DEM"],
+    }
+    candidates, rejected = candidate.make_candidates(columns)
+
+    expected = []
+    expected_rejected = []
+    for row in range(7):
+      data = dict((k, v[row]) for k, v in columns.items()
+                  if v[row] is not missing)
+      try:
+        expected.append(candidate.make_candidate(data).data())
+      except candidate.CandidateException:
+        expected_rejected.append(row)
+
+    self.assertEqual([x.data() for x in candidates], expected)
+    self.assertEqual([row for row, _ in rejected], expected_rejected)
+    self.assertEqual([row for row, _ in rejected], [3, 4, 6])
+    # A senate candidate with an empty district is fine, and has no district.
+    mabel = candidates[-1]
+    self.assertEqual(mabel.name(), "Mabel Banana")
+    self.assertFalse("district" in mabel.data())
+    self.assertEqual(mabel.as_list(), ["Mabel Banana", "senate", "Alabama",
+                                       "", "", "", "", ""])
+    self.assertFalse("district =" in mabel.wikipedia_content())
+    self.assertTrue("the US Senate for Alabama" in mabel.wikipedia_content())
+
+    self.assertRaises(ValueError, candidate.make_candidates,
+                      {"can_nam": ["A"], "can_off": []})
+
   def test_location(self):
     """Test district and state munging."""
     cases = [
@@ -104,15 +150,26 @@ class TestCandidate(unittest.TestCase):
     data = {"can_nam": "Some Person", "office": "house", "party": "DEM",
             "can_off_sta": "NM", "can_off_dis": "New Mexico 7"}
 
-    got = candidate.make_candidate(data).wikipedia_content()
-    # fields could come out in any order, so we can't do a full match;
-    # we just check that something plausible came out.
+    person = candidate.make_candidate(data)
+    got = person.wikipedia_content()
     expected_re = re.compile(
         "^{{Infobox Officeholder\n.*| name = Some Person\n.*}}$")
     match = expected_re.search(got)
 
     self.assertTrue(match)
 
+    # Fields come out in the same order, whatever order the dict has them in.
+    self.assertTrue(got.startswith("{{Infobox Officeholder\n"
+                                   "| name = Some Person\n"
+                                   "| office = house\n"
+                                   "| state = New Mexico\n"
+                                   "| district = 7th\n"))
+    for items in [sorted(person.data().items()),
+                  sorted(person.data().items(), reverse=True)]:
+      self.assertEqual(candidate.Candidate(
+          person.name(), collections.OrderedDict(items)).wikipedia_content(),
+                       got)
+
 
   def test_wikipedia_html(self):
     """Test parsing wikipedia html.
@@ -155,6 +212,81 @@ class TestCandidate(unittest.TestCase):
     ]
     self.assertEqual(got, expected)
 
+  def test_wikitext(self):
+    """Test that parsing wikitext gets the same candidates as the html.
+
+    Reads test_house.wiki, the wikitext of test_house.html.
+    """
+    got = [x.data() for x in candidate.new_from_wikitext("test_house.wiki",
+                                                         "house")]
+    expected = [x.data() for x in candidate.new_from_wikipedia_page(
+        "test_house.html", "house")]
+    self.assertEqual(len(got), 2)
+    self.assertEqual(got, expected)
+
+    # test_arizona.wiki has what test_house.wiki doesn't: shading on
+    # rowspanned cells, named refs used again in later rows, and links in
+    # the status column. Neither parser follows a rowspan into the next row,
+    # so both skip the special election's candidate.
+    got = [x.data() for x in candidate.new_from_wikitext("test_arizona.wiki",
+                                                         "house")]
+    expected = [x.data() for x in candidate.new_from_wikipedia_page(
+        "test_arizona.html", "house")]
+    self.assertEqual([x["name"] for x in got], [u"Pageless Three",
+                                                u"Pageless Four"])
+    self.assertEqual(got[1]["reference_name"],
+                     u'"Who\'s running for Congress in Arizona?"')
+    self.assertEqual(got[0]["status"],
+                     u"Incumbent retiring to run for U.S. Senate")
+    self.assertEqual(got, expected)
+
+  def test_wikipedia_html_delta(self):
+    """Test re-reading only the changed rows of a wikipedia page."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+      filename = os.path.join(tmpdir, "house.html")
+      shutil.copy("test_house.html", filename)
+      got, delta, rows = candidate.diff_wikipedia_page(filename, "house", {})
+      self.assertEqual([x.name() for x in got], ["Pageless One",
+                                                 "Pageless Two"])
+      self.assertEqual([x["name"] for x in delta["added"]],
+                       ["Pageless One", "Pageless Two"])
+
+      # Nothing changed. Rows survive being saved as json.
+      rows = json.loads(json.dumps(rows))
+      got, delta, rows = candidate.diff_wikipedia_page(filename, "house", rows)
+      self.assertEqual([x.name() for x in got], ["Pageless One",
+                                                 "Pageless Two"])
+      self.assertEqual(delta, {"added": [], "changed": [], "removed": []})
+      # Reused rows make exactly the same pages as parsing them afresh.
+      fresh = candidate.new_from_wikipedia_page(filename, "house")
+      self.assertEqual([x.wikipedia_content() for x in got],
+                       [x.wikipedia_content() for x in fresh])
+
+      # One candidate renamed, one district gone.
+      html = open("test_house.html").read()
+      html = html.replace("Pageless One", "Pageless Three")
+      html = html.replace("Alaska&#160;at-large", "Alaska&#160;nowhere")
+      with open(filename, "w") as out:
+        out.write(html)
+      got, delta, rows = candidate.diff_wikipedia_page(filename, "house", rows)
+      self.assertEqual([x.name() for x in got], ["Pageless Three"])
+      self.assertEqual([x["name"] for x in delta["changed"]],
+                       ["Pageless Three"])
+      self.assertEqual([x["name"] for x in delta["removed"]],
+                       ["Pageless Two"])
+      self.assertEqual(delta["added"], [])
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_lazy_imports(self):
+    """Test that importing candidate doesn't import any of the slow parsers."""
+    script = ("import sys; import candidate; "
+              "print(sorted(m for m in ('bs4', 'lxml', 'us', 'yaml') "
+              "if m in sys.modules))")
+    got = subprocess.check_output([sys.executable, "-c", script])
+    self.assertEqual(got.strip(), "[]")
+
 
 if __name__ == 'main__':
   unittest.main()
@@ -0,0 +1,313 @@
+#!/usr/bin/python2.7
+"""Tests for candidatebot.py. Run them with py.test."""
+
+import argparse
+import os
+import shutil
+import StringIO
+import sys
+import tempfile
+import types
+
+import requests
+
+import candidate
+import candidatebot
+import checkpoint
+import mediawiki
+import schedule
+import watch
+from test_mediawiki import FakeApiTestCase, fake_wiki
+
+
+def _person(name, state="Ohio", office="senate"):
+  """Make a candidate."""
+  return candidate.make_candidate({"name": name, "office": office,
+                                   "state": state, "party": "Democratic"})
+
+
+# pylint: disable=too-many-public-methods
+class TestCandidatebot(FakeApiTestCase):
+  """Tests for candidatebot.py, against a FakeApi."""
+
+  def setUp(self):
+    FakeApiTestCase.setUp(self)
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    FakeApiTestCase.tearDown(self)
+    shutil.rmtree(self.tmpdir)
+
+  def journal(self, resume=False):
+    """Return a journal in the temporary directory."""
+    return checkpoint.Journal(os.path.join(self.tmpdir, "journal"),
+                              resume=resume)
+
+  def test_plan(self):
+    """Test planning and then applying page creation."""
+    self.api.pages[u"Live Page"] = (u"text", u"Someone")
+    self.api.pages[u"Draft:Has Draft"] = (u"text", u"Someone")
+    people = [_person(u"Live Page"), _person(u"Has Draft"),
+              _person(u"New One"), _person(u"New Two", state="Iowa"),
+              _person(u"New Two", state="Utah")]
+    people += [_person(u"Person %s" % i) for i in range(30)]
+    plan = candidatebot.make_plan(self.wiki, people)
+    # Two titles per candidate, 50 titles per query.
+    self.assertEqual(len(self.api.calls), 2)
+    self.assertEqual(plan["wiki"], self.wiki.url)
+    self.assertEqual(plan["draft_prefix"], "Draft:")
+    self.assertEqual([(x["name"], x["reason"]) for x in plan["skip"]],
+                     [(u"Live Page", "page exists"),
+                      (u"Has Draft", "draft exists")])
+    self.assertEqual([x["name"] for x in plan["conflict"]], [u"New Two"])
+    self.assertEqual([x["title"] for x in plan["create"]][:2],
+                     [u"Draft:New One", u"Draft:New Two"])
+    self.assertEqual(len(plan["create"]), 32)
+
+    page_hashes = {}
+    journal = self.journal()
+    created = candidatebot.apply_plan(self.wiki, plan, journal, page_hashes,
+                                      max_pages=2)
+    journal.close()
+    self.assertEqual(created, 2)
+    self.assertTrue(u"Draft:New Two" in self.api.pages)
+    self.assertFalse(u"Draft:Person 0" in self.api.pages)
+    self.assertEqual(page_hashes[u"Draft:New One"],
+                     self.api.sha1(self.api.pages[u"Draft:New One"][0]))
+
+    # Resuming skips what's done.
+    journal = self.journal(resume=True)
+    created = candidatebot.apply_plan(self.wiki, plan, journal, page_hashes,
+                                      max_pages=1)
+    journal.close()
+    self.assertEqual(created, 1)
+    self.assertTrue(u"Draft:Person 0" in self.api.pages)
+
+    # A plan for somewhere else isn't applied.
+    plan["draft_prefix"] = "User:Someone/"
+    journal = self.journal(resume=True)
+    try:
+      self.assertRaises(SystemExit, candidatebot.apply_plan, self.wiki, plan,
+                        journal, page_hashes, 10)
+    finally:
+      journal.close()
+    self.assertFalse(u"User:Someone/Person 1" in self.api.pages)
+
+  def test_update_drafts(self):
+    """Test refreshing drafts without overwriting anyone else's edits."""
+    self.wiki.username = "Candidatebot"
+    people = [_person(u"Unchanged"), _person(u"Ours"), _person(u"Edited"),
+              _person(u"Adopted"), _person(u"Not Ours"), _person(u"No Draft"),
+              _person(u"Ours Too")]
+    content = dict((x.name(), x.wikipedia_content()) for x in people)
+    old = u"old content"
+    self.api.pages = {
+      u"Draft:Unchanged": (content[u"Unchanged"].rstrip(), u"Someone"),
+      u"Draft:Ours": (old, u"Candidatebot"),
+      u"Draft:Edited": (u"edited", u"Someone"),
+      u"Draft:Adopted": (old, u"Candidatebot"),
+      u"Draft:Not Ours": (old, u"Someone"),
+      u"Draft:Ours Too": (old, u"Candidatebot"),
+    }
+    page_hashes = {
+      u"Draft:Ours": self.api.sha1(old),
+      u"Draft:Edited": self.api.sha1(old),
+      u"Draft:Ours Too": self.api.sha1(old),
+    }
+    updated = candidatebot.update_drafts(self.wiki, people, page_hashes,
+                                         max_pages=2)
+    self.assertEqual(updated, 2)
+    texts = dict((title, text) for title, (text, _) in self.api.pages.items())
+    self.assertEqual(texts[u"Draft:Ours"], content[u"Ours"].rstrip())
+    self.assertEqual(texts[u"Draft:Adopted"], content[u"Adopted"].rstrip())
+    self.assertEqual(texts[u"Draft:Edited"], u"edited")
+    self.assertEqual(texts[u"Draft:Not Ours"], old)
+    self.assertEqual(texts[u"Draft:Ours Too"], old)  # Out of budget.
+    self.assertFalse(u"Draft:No Draft" in texts)
+    for title in [u"Draft:Unchanged", u"Draft:Ours", u"Draft:Adopted"]:
+      self.assertEqual(page_hashes[title], self.api.sha1(texts[title]))
+    self.assertEqual(page_hashes[u"Draft:Edited"], self.api.sha1(old))
+    self.assertFalse(u"Draft:Not Ours" in page_hashes)
+
+    # Next time, the rest get done.
+    updated = candidatebot.update_drafts(self.wiki, people, page_hashes,
+                                         max_pages=2)
+    self.assertEqual(updated, 1)
+    self.assertEqual(self.api.pages[u"Draft:Ours Too"][0],
+                     content[u"Ours Too"].rstrip())
+
+  def test_watch_sources_survives_failures(self):
+    """Test that a broken source or a failed sync doesn't stop the watching."""
+    good = os.path.join(self.tmpdir, "good.yaml")
+    broken = os.path.join(self.tmpdir, "broken.yaml")
+    with open(good, "w") as out:
+      out.write('- {name: "Good Person", office: senate, state: Ohio}\n')
+    with open(broken, "w") as out:
+      out.write('- {name: "Fixed Person"\n')
+    sources = [("yaml", good, None), ("yaml", broken, None)]
+    args = argparse.Namespace(
+        delta=None, journal=os.path.join(self.tmpdir, "journal"),
+        resume=False, output=os.path.join(self.tmpdir, "out.csv"),
+        max_pages=10)
+    waits = []
+
+    def wait_for_changes(unused_watcher):
+      """Fix everything, then stop."""
+      waits.append(True)
+      if len(waits) > 1:
+        raise KeyboardInterrupt()
+      with open(broken, "w") as out:
+        out.write('- {name: "Fixed Person", office: senate, state: Ohio}\n')
+      self.api.fail = False
+      return set([broken])
+
+    watcher_for = watch.watcher_for
+    waiter = watch.wait_for_changes
+    cwd = os.getcwd()
+    watch.watcher_for = lambda unused: watch.PollingWatcher([])
+    watch.wait_for_changes = wait_for_changes
+    os.chdir(self.tmpdir)  # For the page hashes.
+    self.api.fail = True
+    try:
+      candidatebot.watch_sources(sources, None, self.wiki, args)
+    finally:
+      os.chdir(cwd)
+      watch.watcher_for = watcher_for
+      watch.wait_for_changes = waiter
+    self.assertEqual(len(waits), 2)
+    # The good source failed to sync, so it was tried again with the fix.
+    self.assertTrue(u"Draft:Good Person" in self.api.pages)
+    self.assertTrue(u"Draft:Fixed Person" in self.api.pages)
+
+  def test_get_targets(self):
+    """Test looking up targets in credentials.py."""
+    credentials = types.ModuleType("credentials")
+    credentials.TARGETS = [{"name": "live", "url": "http://live/"},
+                           {"name": "staging", "url": "http://staging/"}]
+    saved = sys.modules.get("credentials")
+    sys.modules["credentials"] = credentials
+    try:
+      self.assertEqual([x["url"] for x in candidatebot.get_targets(
+          ["staging", "live"])], ["http://staging/", "http://live/"])
+      self.assertRaises(SystemExit, candidatebot.get_targets,
+                        ["live", "nowhere"])
+      del credentials.TARGETS
+      self.assertRaises(SystemExit, candidatebot.get_targets, ["live"])
+    finally:
+      if saved is None:
+        del sys.modules["credentials"]
+      else:
+        sys.modules["credentials"] = saved
+
+  def test_sync_targets(self):
+    """Test syncing several targets at once, one of which fails."""
+    wikis = {"staging": fake_wiki(self.api, "User:Candidatebot/"),
+             "live": self.wiki,
+             "broken": fake_wiki(self.api, "Broken:")}
+
+    def does_page_exist(unused_title):
+      """Fail in a way nothing expects."""
+      raise RuntimeError("down")
+    wikis["broken"].does_page_exist = does_page_exist
+
+    people = [_person(u"One Person"), _person(u"Two Person")]
+    args = argparse.Namespace(update=False, resume=False, max_pages=10,
+                              journal=os.path.join(self.tmpdir, "journal"))
+    connect_to_wiki = candidatebot.connect_to_wiki
+    cwd = os.getcwd()
+    stdout = sys.stdout
+    candidatebot.connect_to_wiki = lambda target: wikis[target["name"]]
+    os.chdir(self.tmpdir)  # For the page hashes.
+    sys.stdout = StringIO.StringIO()
+    try:
+      self.assertRaises(SystemExit, candidatebot.sync_targets,
+                        [{"name": "staging"}, {"name": "broken"},
+                         {"name": "live"}], people, args)
+      output = sys.stdout.getvalue()
+    finally:
+      sys.stdout = stdout
+      os.chdir(cwd)
+      candidatebot.connect_to_wiki = connect_to_wiki
+
+    for title in [u"User:Candidatebot/One Person", u"Draft:One Person",
+                  u"User:Candidatebot/Two Person", u"Draft:Two Person"]:
+      self.assertTrue(title in self.api.pages, title)
+    self.assertFalse(u"Broken:One Person" in self.api.pages)
+    self.assertTrue(os.path.exists(os.path.join(
+        self.tmpdir, candidatebot.PAGE_HASHES_FILE + ".staging")))
+    self.assertTrue(os.path.exists(os.path.join(self.tmpdir, "journal.live")))
+    self.assertTrue("staging: Created 2 pages\n" in output)
+    self.assertTrue("broken: Failed: RuntimeError: down\n" in output)
+    self.assertTrue(output.endswith("Failed to sync broken\n"))
+
+  def test_create_from_queue(self):
+    """Test that candidates with pages aren't queued again on later runs."""
+    self.api.pages[u"Live Page"] = (u"text", u"Someone")
+    people = [_person(u"Live Page"), _person(u"New One"), _person(u"New Two")]
+    args = argparse.Namespace(
+        queue=os.path.join(self.tmpdir, "queue.json"),
+        priority=",".join(schedule.DEFAULT_PRIORITY), window=None,
+        journal=os.path.join(self.tmpdir, "journal"), resume=False,
+        max_pages=1)
+    cwd = os.getcwd()
+    os.chdir(self.tmpdir)  # For the page hashes.
+    try:
+      candidatebot.create_from_queue(self.wiki, people, args)
+      queue = schedule.EditQueue(args.queue)
+      self.assertTrue(queue.is_done(u"Live Page"))
+      self.assertTrue(queue.is_done(u"New One"))
+      self.assertEqual(len(queue), 1)
+
+      # A fresh journal doesn't matter: the queue remembers who's done.
+      del self.api.calls[:]
+      candidatebot.create_from_queue(self.wiki, people, args)
+    finally:
+      os.chdir(cwd)
+    self.assertTrue(u"Draft:New Two" in self.api.pages)
+    asked = u" ".join(call.get("titles", u"") for call in self.api.calls)
+    self.assertTrue(u"New Two" in asked)
+    self.assertFalse(u"New One" in asked)
+    self.assertFalse(u"Live Page" in asked)
+    self.assertEqual(len(schedule.EditQueue(args.queue)), 0)
+
+  def test_fetch_wikitext_fails(self):
+    """Test that a network error while fetching wikitext stops the run."""
+    def get(unused_url, **unused):
+      """Fail, like a network that's down."""
+      raise requests.ConnectionError("no route to host")
+    self.api.get = get
+    filename = os.path.join(self.tmpdir, "house.wiki")
+    self.assertRaises(SystemExit, candidatebot.fetch_wikitext, "house",
+                      filename)
+    self.assertFalse(os.path.exists(filename))
+
+  def test_create_pages_counts_past_failures(self):
+    """Test that pages created before a failure still count towards
+    max_pages."""
+    does_page_exist = self.wiki.does_page_exist
+
+    def flaky(title):
+      """Fail for one candidate, like a dropped connection."""
+      if title == u"Two Person":
+        raise requests.ConnectionError("connection reset")
+      return does_page_exist(title)
+    self.wiki.does_page_exist = flaky
+
+    people = [_person(u"One Person"), _person(u"Two Person"),
+              _person(u"Three Person"), _person(u"Four Person")]
+    journal = self.journal()
+    try:
+      created = candidatebot.create_pages(self.wiki, people, journal, {},
+                                          max_pages=2)
+      self.assertEqual(created, 2)
+      self.assertEqual(journal.state(u"Two Person"), checkpoint.FAILED)
+    finally:
+      journal.close()
+    self.assertEqual(sorted(x for x in self.api.pages if "Person" in x),
+                     [u"Draft:One Person", u"Draft:Three Person"])
+
+  def test_fetch_sources_without_urls(self):
+    """Test that sources we can't download always count as changed."""
+    filename = os.path.join(self.tmpdir, "candidates.yaml")
+    self.assertEqual(candidatebot.fetch_sources([("yaml", filename, None)]),
+                     [filename])
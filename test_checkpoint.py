@@ -0,0 +1,91 @@
+#!/usr/bin/python2.7
+"""Tests for checkpoint.py. Run them with py.test."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import checkpoint
+
+
+class TestJournal(unittest.TestCase):
+  """Tests for checkpoint.Journal."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, "journal")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def read(self):
+    """Return what's on disk."""
+    with open(self.filename) as journal:
+      return journal.read()
+
+  def test_later_lines_win(self):
+    """Test that a candidate's last recorded state is the one that counts."""
+    journal = checkpoint.Journal(self.filename)
+    journal.record(u"Am\xe9lie Person", checkpoint.CHECKED)
+    journal.record(u"Am\xe9lie Person", checkpoint.CREATED)
+    journal.record(u"Some Person", checkpoint.CHECKED)
+    journal.record(u"Some Person", checkpoint.FAILED)
+    self.assertEqual(journal.state(u"Some Person"), checkpoint.FAILED)
+    journal.close()
+
+    states = checkpoint.Journal.load(self.filename)
+    self.assertEqual(states, {u"Am\xe9lie Person": checkpoint.CREATED,
+                              u"Some Person": checkpoint.FAILED})
+    self.assertRaises(ValueError, journal.record, u"Some Person", "eaten")
+
+  def test_torn_last_line(self):
+    """Test recovering from a crash part-way through writing a record."""
+    with open(self.filename, "w") as journal:
+      journal.write("created\tOne Person\nexists\tTwo Person\ncrea")
+    self.assertEqual(checkpoint.Journal.load(self.filename),
+                     {u"One Person": checkpoint.CREATED,
+                      u"Two Person": checkpoint.EXISTS})
+
+    # Resuming starts the next record on a new line.
+    journal = checkpoint.Journal(self.filename, resume=True)
+    self.assertTrue(journal.is_done(u"One Person"))
+    self.assertFalse(journal.is_done(u"Three Person"))
+    journal.record(u"Three Person", checkpoint.CREATED)
+    journal.close()
+    self.assertEqual(self.read(), "created\tOne Person\nexists\tTwo Person\n"
+                                  "crea\ncreated\tThree Person\n")
+    self.assertEqual(checkpoint.Journal.load(self.filename),
+                     {u"One Person": checkpoint.CREATED,
+                      u"Two Person": checkpoint.EXISTS,
+                      u"Three Person": checkpoint.CREATED})
+
+  def test_not_resuming(self):
+    """Test that a journal is started afresh unless resuming."""
+    journal = checkpoint.Journal(self.filename)
+    journal.record(u"One Person", checkpoint.CREATED)
+    journal.close()
+
+    journal = checkpoint.Journal(self.filename)
+    self.assertEqual(journal.state(u"One Person"), None)
+    journal.close()
+    self.assertEqual(self.read(), "")
+    self.assertEqual(checkpoint.Journal.load(
+        os.path.join(self.tmpdir, "nothing")), {})
+
+  def test_sync_every(self):
+    """Test that records reach the disk in batches."""
+    journal = checkpoint.Journal(self.filename, sync_every=3)
+    journal.record(u"One Person", checkpoint.CHECKED)
+    journal.record(u"Two Person", checkpoint.CHECKED)
+    self.assertEqual(self.read(), "")
+    journal.record(u"Three Person", checkpoint.CHECKED)
+    self.assertEqual(self.read().count("\n"), 3)
+    journal.record(u"Four Person", checkpoint.CHECKED)
+    self.assertEqual(self.read().count("\n"), 3)
+    journal.close()
+    self.assertEqual(self.read().count("\n"), 4)
+
+
+if __name__ == '__main__':
+  unittest.main()
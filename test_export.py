@@ -0,0 +1,52 @@
+#!/usr/bin/python2.7
+"""Tests for export.py. Run them with py.test."""
+
+import hashlib
+import StringIO
+import unittest
+
+from lxml import etree
+
+import candidate
+import export
+
+NAMESPACES = {"m": export.EXPORT_NAMESPACE}
+
+# pylint: disable=too-many-public-methods
+class TestExport(unittest.TestCase):
+  """Tests for export.py."""
+
+  def test_import_dump(self):
+    """Test that every page, and the list of pages, round-trips."""
+    people = list(candidate.new_from_wikipedia_page("test_house.html",
+                                                    "house"))
+    people.append(candidate.Candidate(u"Am\xe9lie <&> Person",
+                                      {"office": "senate",
+                                       "state": "Alaska"}))
+    out = StringIO.StringIO()
+    page_hashes = {}
+    written = export.write_import_dump(people, out, draft_prefix="Draft:",
+                                       page_hashes=page_hashes)
+    self.assertEqual(written, 3)
+
+    root = etree.fromstring(out.getvalue())
+    titles = root.xpath("m:page/m:title/text()", namespaces=NAMESPACES)
+    texts = root.xpath("m:page/m:revision/m:text/text()",
+                       namespaces=NAMESPACES)
+    self.assertEqual(titles, [
+      "Draft:Pageless One",
+      "Draft:Pageless Two",
+      u"Draft:Am\xe9lie <&> Person",
+      "Draft:CandidatebotListOfPages",
+    ])
+    self.assertEqual(texts[:3],
+                     [x.wikipedia_content().rstrip() for x in people])
+    # Recorded as the hash the wiki will report once they're imported.
+    self.assertEqual(page_hashes, dict(
+        (title, hashlib.sha1(text.encode('utf-8')).hexdigest())
+        for title, text in zip(titles, texts[:3])))
+    self.assertEqual(texts[3], "".join("[[%s]]<br>" % x for x in titles[:3]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/python2.7
+"""Tests for fetch.py. Run them with py.test."""
+
+import BaseHTTPServer
+import gzip
+import os
+import shutil
+import StringIO
+import tempfile
+import threading
+import time
+import unittest
+
+import fetch
+
+
+class FakeSourceHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Serves the server's |content|, gzipped, with an ETag and Last-Modified,
+  and answers conditional requests with a 304."""
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    """Serve the content, or a 304."""
+    self.server.requests.append(dict(self.headers))
+    etag = '"%s"' % self.server.version
+    if self.headers.get("If-None-Match") == etag:
+      self.send_response(304)
+      self.end_headers()
+      return
+
+    body = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=body, mode='wb') as zipped:
+      zipped.write(self.server.content)
+    self.send_response(200)
+    self.send_header("Content-Encoding", "gzip")
+    self.send_header("Content-Length", str(len(body.getvalue())))
+    self.send_header("ETag", etag)
+    self.send_header("Last-Modified", "Sat, 01 Oct 2016 00:00:00 GMT")
+    self.end_headers()
+    self.wfile.write(body.getvalue())
+
+  def log_message(self, *args):
+    """Keep test output quiet."""
+    pass
+
+
+# pylint: disable=too-many-public-methods
+class TestFetch(unittest.TestCase):
+  """Tests for fetch.py."""
+
+  def setUp(self):
+    self.server = BaseHTTPServer.HTTPServer(("localhost", 0),
+                                            FakeSourceHandler)
+    self.server.requests = []
+    self.server.content = "<html>version one</html>"
+    self.server.version = 1
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+    self.url = "http://localhost:%s/house" % self.server.server_port
+    self.tmpdir = tempfile.mkdtemp()
+    self.filename = os.path.join(self.tmpdir, "house.html")
+    self.cache_dir = os.path.join(self.tmpdir, "cache")
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.thread.join()
+    shutil.rmtree(self.tmpdir)
+
+  def fetch(self):
+    """Fetch the fake source."""
+    return fetch.fetch(self.url, self.filename, cache_dir=self.cache_dir)
+
+  def test_conditional_fetch(self):
+    """Test that only changed sources are downloaded."""
+    self.assertTrue(self.fetch())
+    self.assertEqual(open(self.filename).read(), "<html>version one</html>")
+    self.assertIn("gzip", self.server.requests[0]["accept-encoding"])
+    self.assertNotIn("if-none-match", self.server.requests[0])
+
+    # Unchanged: a 304, and the file is left alone.
+    self.assertFalse(self.fetch())
+    self.assertEqual(self.server.requests[1]["if-none-match"], '"1"')
+    self.assertEqual(self.server.requests[1]["if-modified-since"],
+                     "Sat, 01 Oct 2016 00:00:00 GMT")
+    self.assertEqual(open(self.filename).read(), "<html>version one</html>")
+
+    # Changed.
+    self.server.content = "<html>version two</html>"
+    self.server.version = 2
+    self.assertTrue(self.fetch())
+    self.assertEqual(open(self.filename).read(), "<html>version two</html>")
+
+    # If the file has gone, it's downloaded again.
+    os.remove(self.filename)
+    self.assertTrue(self.fetch())
+    self.assertNotIn("if-none-match", self.server.requests[-1])
+
+  def test_error(self):
+    """Test that a failed download raises and keeps the last good copy."""
+    self.assertTrue(self.fetch())
+    self.url += "/missing"
+    self.server.RequestHandlerClass = BrokenHandler
+    self.assertRaises(fetch.FetchException, self.fetch)
+    self.assertEqual(open(self.filename).read(), "<html>version one</html>")
+
+  def test_broken_download(self):
+    """Test that a download that fails part-way, or stalls, raises and
+    leaves nothing behind."""
+    self.assertTrue(self.fetch())
+    for handler in [TruncatedHandler, StalledHandler]:
+      self.server.RequestHandlerClass = handler
+      self.assertRaises(fetch.FetchException, fetch.fetch, self.url,
+                        self.filename, cache_dir=self.cache_dir, timeout=0.2)
+      self.assertEqual(open(self.filename).read(), "<html>version one</html>")
+      self.assertEqual(os.listdir(self.tmpdir), ["cache", "house.html"])
+
+
+class BrokenHandler(FakeSourceHandler):
+  """Always fails."""
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    """Fail."""
+    self.send_error(500)
+
+
+class TruncatedHandler(FakeSourceHandler):
+  """Starts a chunked response, then sends garbage."""
+  protocol_version = "HTTP/1.1"
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    """Send part of a response."""
+    self.send_response(200)
+    self.send_header("Transfer-Encoding", "chunked")
+    self.send_header("Connection", "close")
+    self.end_headers()
+    self.wfile.write("6\r\n<html>\r\nnot a chunk\r\n")
+
+
+class StalledHandler(FakeSourceHandler):
+  """Starts a response, then stops sending."""
+
+  def do_GET(self):  # pylint: disable=invalid-name
+    """Send part of a response, slowly."""
+    self.send_response(200)
+    self.send_header("Content-Length", "1000")
+    self.end_headers()
+    self.wfile.write("<html>")
+    self.wfile.flush()
+    time.sleep(0.5)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,339 @@
+#!/usr/bin/python2.7
+"""Tests for mediawiki.py. Run them with py.test."""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urlparse
+
+import mediawiki
+
+CALLS_PER_SECOND = 20
+URL = "http://wiki.example.com/w/"
+
+
+@mediawiki.rate_limited(CALLS_PER_SECOND, budget="test")
+def record_call(calls):
+  """Note when this was called."""
+  calls.put(time.time())
+
+
+class Budgeted(object):
+  """Something with its own rate budget, like a Wiki."""
+
+  def __init__(self, key, rate_limits=None):
+    self.rate_limit_key = key
+    self.rate_limits = rate_limits or {}
+
+  @mediawiki.rate_limited(CALLS_PER_SECOND, budget="test")
+  def call(self):
+    """Note when this was called."""
+    return time.time()
+
+
+def call_repeatedly(rate_limit_dir, calls):
+  """Call record_call a few times, sharing rate limits via rate_limit_dir."""
+  mediawiki.RATE_LIMIT_DIR = rate_limit_dir
+  for _ in range(4):
+    record_call(calls)
+
+
+class FakeResponse(object):
+  """Just enough of a requests.Response."""
+
+  def __init__(self, url, data, status_code=200):
+    self.url = url
+    self.status_code = status_code
+    self.ok = status_code == 200
+    self.reason = "OK" if self.ok else "Internal Server Error"
+    self.text = json.dumps(data)
+    self.cookies = {}
+
+  def json(self):
+    """Return the parsed response."""
+    return json.loads(self.text)
+
+
+class FakeApi(object):
+  """Stands in for the requests module, answering like a wiki's api.php.
+
+  Pages are kept in |pages| as title to (text, user who last edited it).
+  Every request's parameters are kept in |calls|.
+  """
+
+  def __init__(self, username="Candidatebot"):
+    self.username = username
+    self.pages = {}
+    self.calls = []
+    self.fail = False
+
+  @staticmethod
+  def normalize(title):
+    """Spell a title the way the wiki does."""
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+  @staticmethod
+  def sha1(text):
+    """Hash some page text."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+  def get(self, url, params=None, **unused):
+    """Answer a GET."""
+    return self._answer(url, dict(params or {}))
+
+  def post(self, url, data=None, **unused):
+    """Answer a POST."""
+    return self._answer(url, dict(data or {}))
+
+  def _answer(self, url, params):
+    """Answer a request to api.php."""
+    url, _, query = url.partition("?")
+    params.update(urlparse.parse_qsl(query, keep_blank_values=True))
+    self.calls.append(params)
+    if self.fail:
+      return FakeResponse(url, {}, 500)
+    if params["action"] == "query" and params.get("meta") == "tokens":
+      return FakeResponse(url, {"query": {"tokens": {"csrftoken": "+\\"}}})
+    if params["action"] == "query":
+      return FakeResponse(url, self._query(params))
+    if params["action"] == "edit":
+      return FakeResponse(url, self._edit(params))
+    raise ValueError("Unexpected request: %s" % params)
+
+  def _query(self, params):
+    """Look up some titles. Like the real thing, only the first
+    mediawiki.TITLES_PER_QUERY are looked up."""
+    titles = params["titles"].split("|")[:mediawiki.TITLES_PER_QUERY]
+    query = {"normalized": [], "pages": {}}
+    for missing, title in enumerate(titles):
+      normalized = self.normalize(title)
+      if normalized != title:
+        query["normalized"].append({"from": title, "to": normalized})
+      if normalized not in self.pages:
+        query["pages"][str(-1 - missing)] = {"title": normalized,
+                                             "missing": ""}
+        continue
+      text, user = self.pages[normalized]
+      page = {"title": normalized,
+              "fullurl": URL + "index.php/" + normalized.replace(" ", "_")}
+      if "revisions" in params.get("prop", ""):
+        page["revisions"] = [{"sha1": self.sha1(text), "user": user}]
+      query["pages"][str(len(query["pages"]) + 1)] = page
+    return {"query": query}
+
+  def _edit(self, params):
+    """Edit a page."""
+    title = self.normalize(params["title"])
+    if params.get("createonly") and title in self.pages:
+      return {"error": {"code": "articleexists"}}
+    if params.get("nocreate") and title not in self.pages:
+      return {"error": {"code": "missingtitle"}}
+    if "appendtext" in params:
+      text = self.pages.get(title, (u"", None))[0] + params["appendtext"]
+    else:
+      text = params["text"]
+    # Like the real thing, trailing whitespace isn't saved.
+    self.pages[title] = (text.rstrip(), self.username)
+    return {"edit": {"result": "Success", "title": title}}
+
+
+def fake_wiki(api, draft_prefix="Draft:"):
+  """Return a Wiki that talks to a FakeApi, as fast as it likes."""
+  mediawiki.requests = api
+  mediawiki.RATE_LIMIT_DIR = None
+  wiki = mediawiki.Wiki(URL, None, None, draft_prefix=draft_prefix,
+                        edits_per_second=1000, queries_per_second=1000)
+  wiki.login_cookies = {}
+  return wiki
+
+
+class FakeApiTestCase(unittest.TestCase):
+  """Runs each test with |self.api|, a FakeApi, and |self.wiki| using it."""
+
+  def setUp(self):
+    self.requests = mediawiki.requests
+    self.rate_limit_dir = mediawiki.RATE_LIMIT_DIR
+    self.api = FakeApi()
+    self.wiki = fake_wiki(self.api)
+
+  def tearDown(self):
+    mediawiki.requests = self.requests
+    mediawiki.RATE_LIMIT_DIR = self.rate_limit_dir
+
+
+class TestWiki(FakeApiTestCase):
+  """Tests for mediawiki.Wiki, against a FakeApi."""
+
+  def test_which_pages_exist(self):
+    """Test looking up lots of titles, some of which the wiki respells."""
+    self.api.pages[u"Some person"] = (u"text", u"Someone")
+    self.api.pages[u"Draft:Other Person"] = (u"text", u"Someone")
+    titles = [u"some person", u"Some person", u"Draft:Other Person"] + [
+        u"Person %s" % i for i in range(60)]
+    got = self.wiki.which_pages_exist(titles)
+    self.assertEqual(sorted(got), sorted(titles))
+    self.assertEqual(got[u"some person"], URL + "index.php/Some_person")
+    self.assertEqual(got[u"Some person"], URL + "index.php/Some_person")
+    self.assertEqual(got[u"Draft:Other Person"],
+                     URL + "index.php/Draft:Other_Person")
+    self.assertEqual(got[u"Person 59"], None)
+    self.assertEqual(len(self.api.calls), 2)
+
+    self.api.fail = True
+    self.assertRaises(mediawiki.WikiException, self.wiki.which_pages_exist,
+                      titles)
+
+
+  def test_latest_revisions(self):
+    """Test fetching the hash and author of the latest revisions."""
+    self.api.pages[u"Some person"] = (u"text", u"Someone")
+    self.api.pages[u"Draft:Other Person"] = (u"other", u"Candidatebot")
+    titles = [u"some person", u"Draft:Other Person", u"Nobody"]
+    revisions = self.wiki.latest_revisions(titles)
+    self.assertEqual(revisions, {
+      u"some person": {"sha1": self.api.sha1(u"text"), "user": u"Someone"},
+      u"Draft:Other Person": {"sha1": self.api.sha1(u"other"),
+                              "user": u"Candidatebot"},
+      u"Nobody": None})
+
+    self.assertFalse(self.wiki.is_own_revision(revisions[u"some person"]))
+    self.assertFalse(self.wiki.is_own_revision(
+        revisions[u"Draft:Other Person"]))
+    self.wiki.username = "candidatebot"
+    self.assertTrue(self.wiki.is_own_revision(
+        revisions[u"Draft:Other Person"]))
+
+  def test_content_hash(self):
+    """Test that content_hash agrees with what the wiki reports."""
+    content = u"{{Infobox}}\nAm\xe9lie Person\n\n  \n"
+    self.wiki.username = "Candidatebot"
+    self.wiki.create_page_from_text(u"Draft:Am\xe9lie Person", content)
+    revisions = self.wiki.latest_revisions([u"Draft:Am\xe9lie Person"])
+    self.assertEqual(revisions[u"Draft:Am\xe9lie Person"]["sha1"],
+                     mediawiki.Wiki.content_hash(content))
+    self.assertEqual(mediawiki.Wiki.content_hash(content),
+                     mediawiki.Wiki.content_hash(content.encode('utf-8')))
+    self.assertNotEqual(mediawiki.Wiki.content_hash(u"a b"),
+                        mediawiki.Wiki.content_hash(u"a"))
+
+
+# pylint: disable=too-many-public-methods
+class TestMediawiki(unittest.TestCase):
+  """Tests for mediawiki.py."""
+
+  def test_shared_rate_limit(self):
+    """Test that several processes share one rate limit."""
+    rate_limit_dir = tempfile.mkdtemp()
+    try:
+      calls = multiprocessing.Queue()
+      processes = [multiprocessing.Process(target=call_repeatedly,
+                                           args=(rate_limit_dir, calls))
+                   for _ in range(3)]
+      for process in processes:
+        process.start()
+      for process in processes:
+        process.join()
+      times = sorted(calls.get() for _ in range(12))
+    finally:
+      shutil.rmtree(rate_limit_dir)
+
+    # Slots are claimed an interval apart, but calls run outside the lock, so
+    # a process can be scheduled a little late after claiming one.
+    self.assertGreater(times[-1] - times[0], 0.9 * 11 / CALLS_PER_SECOND)
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    self.assertGreater(min(gaps), 0.5 / CALLS_PER_SECOND)
+
+  def test_shared_rate_limit_not_held(self):
+    """Test that a slow call doesn't hold up others sharing its budget, and
+    that a bogus time in the shared file doesn't stall anyone."""
+    rate_limit_dir = tempfile.mkdtemp()
+    interval = 1.0 / CALLS_PER_SECOND
+    finished = {}
+
+    def call(name, seconds):
+      """Use the budget for a while."""
+      with mediawiki.SharedRateLimit("test", interval, rate_limit_dir):
+        time.sleep(seconds)
+      finished[name] = time.time()
+
+    try:
+      start = time.time()
+      slow = threading.Thread(target=call, args=("slow", 1.0))
+      slow.start()
+      time.sleep(interval / 2)
+      call("fast", 0)
+      slow.join()
+      self.assertLess(finished["fast"] - start, 0.5)
+      self.assertGreater(finished["slow"] - start, 1.0)
+
+      with open(os.path.join(rate_limit_dir,
+                             "candidatebot-test.ratelimit"), "w") as out:
+        out.write("1e12")
+      start = time.time()
+      call("after bogus time", 0)
+      self.assertLess(time.time() - start, 2 * interval)
+    finally:
+      shutil.rmtree(rate_limit_dir)
+
+  def test_shared_rate_limit_private(self):
+    """Test that only we can use the shared rate limit's files."""
+    tmpdir = tempfile.mkdtemp()
+    try:
+      directory = os.path.join(tmpdir, "ratelimit")
+      with mediawiki.SharedRateLimit("test", 0, directory):
+        pass
+      self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+      self.assertEqual(os.stat(os.path.join(
+          directory, "candidatebot-test.ratelimit")).st_mode & 0o777, 0o600)
+
+      # A planted link isn't written through.
+      victim = os.path.join(tmpdir, "victim")
+      with open(victim, "w") as out:
+        out.write("precious")
+      os.symlink(victim, os.path.join(directory, "candidatebot-link.ratelimit"))
+      limit = mediawiki.SharedRateLimit("link", 0, directory)
+      self.assertRaises(OSError, limit.__enter__)
+      self.assertEqual(open(victim).read(), "precious")
+    finally:
+      shutil.rmtree(tmpdir)
+
+  def test_rate_limit_budgets(self):
+    """Test that each rate_limit_key gets its own budget, at the rate in its
+    rate_limits."""
+    interval = 1.0 / CALLS_PER_SECOND
+    saved = mediawiki.RATE_LIMIT_DIR
+    rate_limit_dir = tempfile.mkdtemp()
+    try:
+      mediawiki.RATE_LIMIT_DIR = None
+      one, other = Budgeted("one"), Budgeted("other")
+      first = one.call()
+      self.assertLess(other.call() - first, interval / 2)
+      self.assertGreater(one.call() - first, 0.9 * interval)
+
+      slow = Budgeted("slow", {"test": CALLS_PER_SECOND / 5.0})
+      first = slow.call()
+      self.assertGreater(slow.call() - first, 4.5 * interval)
+      fast = Budgeted("fast", {"budget we don't use": 0.01})
+      first = fast.call()
+      self.assertLess(fast.call() - first, 1.5 * interval)
+
+      # Shared between processes, each key has its own file.
+      mediawiki.RATE_LIMIT_DIR = rate_limit_dir
+      Budgeted("one").call()
+      Budgeted("other").call()
+      self.assertEqual(sorted(os.listdir(rate_limit_dir)),
+                       ["candidatebot-test-one.ratelimit",
+                        "candidatebot-test-other.ratelimit"])
+    finally:
+      mediawiki.RATE_LIMIT_DIR = saved
+      shutil.rmtree(rate_limit_dir)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/python2.7
+"""Tests for schedule.py. Run them with py.test."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import candidate
+import schedule
+
+
+def _person(name, **data):
+  """Make a candidate with some data."""
+  data["name"] = name
+  return candidate.Candidate(name, data)
+
+
+class TestSchedule(unittest.TestCase):
+  """Tests for schedule.py."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test_priority_order(self):
+    """Test that candidates come out most important first."""
+    queue = schedule.EditQueue()
+    queue.push(_person("House Incumbent", office="house", state="Alabama",
+                       representative="House Incumbent",
+                       status="Incumbent running", reference_url="x"))
+    queue.push(_person("House Challenger", office="house", state="Alabama",
+                       representative="Someone Else",
+                       status="Incumbent running", reference_url="x"))
+    queue.push(_person("Open Seat", office="house", state="Alabama",
+                       status="Incumbent retiring"))
+    queue.push(_person("Governor", office="governor", state="Vermont",
+                       status="Retiring"))
+    queue.push(_person("Senator", office="senate", state="Ohio"))
+    got = []
+    while len(queue):
+      got.append(queue.pop().name())
+    self.assertEqual(got, ["Senator", "Governor", "Open Seat",
+                           "House Challenger", "House Incumbent"])
+    self.assertEqual(queue.pop(), None)
+
+    # Citations first, then equal priorities in the order they were pushed.
+    queue = schedule.EditQueue(priority=schedule.make_priority(["citation"]))
+    for name in ["A", "B", "C"]:
+      queue.push(_person(name))
+    queue.push(_person("B", reference_url="x"))
+    self.assertEqual([queue.pop().name() for _ in range(3)], ["B", "A", "C"])
+
+    self.assertRaises(ValueError, schedule.make_priority, ["height"])
+
+  def test_persistence(self):
+    """Test that the queue survives between runs."""
+    filename = os.path.join(self.tmpdir, "queue.json")
+    queue = schedule.EditQueue(filename)
+    queue.push(_person(u"Am\xe9lie House", office="house", state="Alabama"))
+    queue.push(_person("Some Senator", office="senate", state="Ohio"))
+    queue.push(_person("Some Governor", office="governor", state="Ohio"))
+    self.assertEqual(queue.pop().name(), "Some Senator")
+    queue.save()
+
+    queue = schedule.EditQueue(filename)
+    self.assertEqual(len(queue), 2)
+    self.assertFalse("Some Senator" in queue)
+    person = queue.pop()
+    self.assertEqual(person.name(), "Some Governor")
+    self.assertEqual(person.data()["state"], "Ohio")
+    self.assertEqual(queue.pop().name(), u"Am\xe9lie House")
+
+  def test_done(self):
+    """Test that candidates marked done aren't queued again."""
+    filename = os.path.join(self.tmpdir, "queue.json")
+    queue = schedule.EditQueue(filename)
+    self.assertTrue(queue.push(_person("Some Senator", office="senate")))
+    self.assertTrue(queue.push(_person(u"Am\xe9lie House", office="house")))
+    queue.mark_done("Some Senator")
+    self.assertFalse("Some Senator" in queue)
+    self.assertFalse(queue.push(_person("Some Senator", office="senate")))
+    self.assertEqual(len(queue), 1)
+    queue.save()
+
+    queue = schedule.EditQueue(filename)
+    self.assertTrue(queue.is_done("Some Senator"))
+    self.assertFalse(queue.is_done(u"Am\xe9lie House"))
+    self.assertFalse(queue.push(_person("Some Senator", office="senate")))
+    self.assertEqual(queue.pop().name(), u"Am\xe9lie House")
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/python2.7
+"""Tests for service.py. Run them with py.test."""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import urllib2
+
+import candidate
+import service
+
+# pylint: disable=too-many-public-methods
+class TestService(unittest.TestCase):
+  """Tests for service.py."""
+
+  def setUp(self):
+    people = list(candidate.new_from_wikipedia_page("test_house.html",
+                                                    "house"))
+    people.append(candidate.make_candidate({
+      "can_nam": "CATFACE, ALEX", "office": "senate", "can_off_sta": "AK"}))
+    self.index = service.CandidateIndex(people)
+
+  def names(self, **criteria):
+    """Return the names of the candidates matching some criteria."""
+    return [x["name"] for x in self.index.lookup(**criteria)]
+
+  def test_lookup(self):
+    """Test looking candidates up by each index and combinations of them."""
+    self.assertEqual(self.names(),
+                     ["Pageless One", "Pageless Two", "Alex Catface"])
+    self.assertEqual(self.names(state="AK"), ["Pageless Two", "Alex Catface"])
+    self.assertEqual(self.names(state="Alaska", office="senate"),
+                     ["Alex Catface"])
+    self.assertEqual(self.names(office="house"),
+                     ["Pageless One", "Pageless Two"])
+    self.assertEqual(self.names(state="AL", district="2"), ["Pageless One"])
+    self.assertEqual(self.names(state="Alabama", district="3rd"), [])
+    self.assertEqual(self.names(state="AL", district="02"), ["Pageless One"])
+    self.assertEqual(self.names(state="AL", district="2nd"), ["Pageless One"])
+    # A district we can't read doesn't widen the search to the whole state.
+    self.assertEqual(self.names(state="AL", district="foo"), [])
+    self.assertEqual(self.names(state="AK", district="at large"), [])
+    self.assertEqual(self.names(state="AK", district="at-large"),
+                     ["Pageless Two"])
+    self.assertEqual(self.names(name="pageless"),
+                     ["Pageless One", "Pageless Two"])
+    self.assertEqual(self.names(name="cat"), ["Alex Catface"])
+    self.assertEqual(self.names(name="ALEX  CAT"), ["Alex Catface"])
+    self.assertEqual(self.names(name="two", office="senate"), [])
+
+  def test_broken_source(self):
+    """Test that a broken source keeps the old candidates until it's fixed."""
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, "candidates.yaml")
+
+    def write(text, mtime):
+      """Replace the source, with a distinct modification time."""
+      with open(filename, "w") as out:
+        out.write(text)
+      os.utime(filename, (mtime, mtime))
+
+    store = None
+    try:
+      write('- {name: "Some Person"}\n', 1000)
+      store = service.CandidateStore([("yaml", filename, None)])
+      stopped = store.watch(interval=0.01)
+      self.assertEqual(len(store.index), 1)
+
+      for broken in ['- {name: "Some Person"\n', "- {}\n", "- 1\n"]:
+        write(broken, 2000 + len(broken))
+        time.sleep(0.1)
+        self.assertEqual(len(store.index), 1)
+
+      write('- {name: "One Person"}\n- {name: "Two Person"}\n', 3000)
+      for _ in range(100):
+        if len(store.index) == 2:
+          break
+        time.sleep(0.01)
+      self.assertEqual([x["name"] for x in store.index.lookup()],
+                       ["One Person", "Two Person"])
+    finally:
+      if store is not None:
+        stopped.set()
+      shutil.rmtree(tmpdir)
+
+  def test_server(self):
+    """Test serving lookups over HTTP."""
+    store = service.CandidateStore([("wikipedia", "test_house.html", "house")])
+    server = service.CandidateServer(("localhost", 0), store)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+      url = "http://localhost:%s/candidates?state=AK" % server.server_port
+      got = json.load(urllib2.urlopen(url))
+      self.assertEqual([x["name"] for x in got], ["Pageless Two"])
+    finally:
+      server.shutdown()
+      server.server_close()
+      thread.join()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/python2.7
+"""Tests for watch.py. Run them with py.test."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import watch
+
+
+# pylint: disable=too-many-public-methods
+class TestWatch(unittest.TestCase):
+  """Tests for watch.py."""
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.watched = os.path.join(self.tmpdir, "house.html")
+    self.other = os.path.join(self.tmpdir, "other.html")
+    for filename in [self.watched, self.other]:
+      with open(filename, "w") as out:
+        out.write("one")
+    self.old_poll_seconds = watch.POLL_SECONDS
+    watch.POLL_SECONDS = 0.05
+
+  def tearDown(self):
+    watch.POLL_SECONDS = self.old_poll_seconds
+    shutil.rmtree(self.tmpdir)
+
+  def check_watcher(self, watcher):
+    """Check a watcher sees writes and renames to the watched file only."""
+    try:
+      self.assertEqual(watcher.changed(timeout=0.1), set())
+
+      with open(self.other, "w") as out:
+        out.write("two")
+      self.assertEqual(watcher.changed(timeout=0.2), set())
+
+      with open(self.watched, "w") as out:
+        out.write("two")
+      self.assertEqual(watch.wait_for_changes(watcher, debounce=0.2),
+                       set([self.watched]))
+
+      temporary = self.watched + ".tmp"
+      with open(temporary, "w") as out:
+        out.write("three!")
+      os.rename(temporary, self.watched)
+      self.assertEqual(watch.wait_for_changes(watcher, debounce=0.2),
+                       set([self.watched]))
+    finally:
+      watcher.close()
+
+  def test_polling(self):
+    """Test the polling watcher."""
+    self.check_watcher(watch.PollingWatcher([self.watched]))
+
+  def test_best_watcher(self):
+    """Test whichever watcher this platform gets (inotify on Linux)."""
+    self.check_watcher(watch.watcher_for([self.watched]))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/python2.7
+"""Tests for wikitext.py. Run them with py.test."""
+
+import unittest
+
+import wikitext
+
+
+class TestWikitext(unittest.TestCase):
+  """Tests for wikitext.py."""
+
+  def test_render(self):
+    """Test turning wikitext into plain text."""
+    cases = {
+      u"[[Name Two]] (Republican)": u"Name Two (Republican)",
+      u"[[Cook PVI|PVI]]": u"PVI",
+      u"{{ushr|Alaska|AL|X}}": u"Alaska at-large",
+      u"{{ushr|Alabama|2|X}}": u"Alabama 2",
+      u"{{sort|117|R+17}}": u"R+17",
+      u"{{nowrap|{{sortname|Amy|Lee}}}}": u"Amy Lee",
+      u"'''Bold''' [http://example.com Example] &amp; co": u"Bold Example & co",
+      u"First<br />elected": u"First\nelected",
+      u"{{efn|A footnote}}[[File:Flag.svg|20px]]Text": u"Text",
+      u"{{plainlist|\n* One\n* Two\n}}": u"One\nTwo",
+    }
+    for k in cases:
+      self.assertEqual(wikitext.render(k), cases[k])
+
+  def test_tables(self):
+    """Test reading tables, cells and citations."""
+    text = u"\n".join([
+      u"{| class=wikitable",
+      u"! Name !! Notes",
+      u"|-",
+      u"| style=\"color:red\" | [[A|Ay]]<ref name=a>{{cite book|title=Book"
+      u"|url=http://b.example.com}}</ref> || B<ref>[http://c.example.com C]"
+      u"</ref>",
+      u"more B<ref name=a />",
+      u"|}",
+      u"{| class=other",
+      u"| Ignored",
+      u"|}",
+    ])
+    tables, citations = wikitext.tables(text, "wikitable")
+    self.assertEqual(len(tables), 1)
+    (_, headers, _), (_, _, columns) = tables[0]
+    self.assertEqual([x.text for x in headers], [u"Name", u"Notes"])
+    self.assertEqual([x.text for x in columns], [u"Ay[1]", u"B[2]\nmore B[1]"])
+    self.assertEqual(columns[1].notes, {u"[1]": u"cite_note-a",
+                                        u"[2]": u"cite_note-1"})
+    self.assertEqual(citations, {
+      u"cite_note-a": (u"Book", u"http://b.example.com"),
+      u"cite_note-1": (u"C", u"http://c.example.com")})
+
+    self.assertEqual(wikitext.split_top_level(u"a|[[b|c]]|{{d|e}}", u"|"),
+                     [u"a", u"[[b|c]]", u"{{d|e}}"])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,196 @@
+#!/usr/bin/python2.7
+
+"""Notice when files change, using inotify on Linux and polling elsewhere."""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+
+# Wait until files have been quiet this long before reporting changes, so
+# that a file being written in several goes is only reported once.
+DEBOUNCE_SECONDS = 2.0
+# How often PollingWatcher checks files.
+POLL_SECONDS = 1.0
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class PollingWatcher(object):
+  """Notices changes by checking modification times every so often."""
+
+  def __init__(self, filenames):
+    """
+    Args:
+      filenames: ([str, ...]) the files to watch.
+    """
+    self.filenames = list(filenames)
+    self._stats = self._stat_all()
+
+  def _stat_all(self):
+    """Return the modification time and size of each file."""
+    stats = {}
+    for filename in self.filenames:
+      try:
+        stat = os.stat(filename)
+        stats[filename] = (stat.st_mtime, stat.st_size)
+      except OSError:
+        stats[filename] = None
+    return stats
+
+  def changed(self, timeout=None):
+    """Wait for files to change.
+
+    Args:
+      timeout: (float) Give up after this many seconds; None waits forever.
+    Returns:
+      (set): the files that changed, or an empty set on timeout.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+      stats = self._stat_all()
+      changed = set(x for x in self.filenames if stats[x] != self._stats[x])
+      self._stats = stats
+      if changed:
+        return changed
+      if deadline is not None and time.time() >= deadline:
+        return set()
+      wait = POLL_SECONDS
+      if deadline is not None:
+        wait = min(wait, max(0, deadline - time.time()))
+      time.sleep(wait)
+
+  def close(self):
+    """Stop watching."""
+    pass
+
+
+class InotifyWatcher(object):
+  """Notices changes as they happen, using Linux's inotify.
+
+  Watches the directories the files are in, rather than the files, so that
+  files replaced by renaming a new copy over them (as fetch.py does) are
+  still noticed.
+  """
+
+  def __init__(self, filenames, libc):
+    """
+    Args:
+      filenames: ([str, ...]) the files to watch.
+      libc: (ctypes.CDLL) a C library with the inotify calls.
+    """
+    self.filenames = list(filenames)
+    self._libc = libc
+    self._fd = libc.inotify_init()
+    if self._fd < 0:
+      raise OSError(ctypes.get_errno(), "inotify_init failed")
+    self._directories = {}  # watch descriptor to directory
+    self._files = {}  # (directory, basename) to the filename we were given
+    mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    for filename in self.filenames:
+      directory, basename = os.path.split(os.path.abspath(filename))
+      self._files[(directory, basename)] = filename
+      if directory in self._directories.values():
+        continue
+      descriptor = libc.inotify_add_watch(self._fd, directory, mask)
+      if descriptor < 0:
+        raise OSError(ctypes.get_errno(), "Can't watch %s" % directory)
+      self._directories[descriptor] = directory
+
+  def changed(self, timeout=None):
+    """Wait for files to change.
+
+    Args:
+      timeout: (float) Give up after this many seconds; None waits forever.
+    Returns:
+      (set): the files that changed, or an empty set on timeout.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while True:
+      wait = None if deadline is None else max(0, deadline - time.time())
+      try:
+        readable, _, _ = select.select([self._fd], [], [], wait)
+      except select.error, ex:
+        if ex.args[0] == errno.EINTR:
+          continue
+        raise
+      if not readable:
+        return set()
+      changed = self._read_events()
+      if changed:
+        return changed
+
+  def _read_events(self):
+    """Read pending events, and return the watched files they were about."""
+    buf = os.read(self._fd, 65536)
+    changed = set()
+    offset = 0
+    while offset < len(buf):
+      descriptor, _, _, length = _EVENT_HEADER.unpack_from(buf, offset)
+      offset += _EVENT_HEADER.size
+      basename = buf[offset:offset + length].rstrip("\0")
+      offset += length
+      key = (self._directories.get(descriptor), basename)
+      if key in self._files:
+        changed.add(self._files[key])
+    return changed
+
+  def close(self):
+    """Stop watching."""
+    os.close(self._fd)
+
+
+def _inotify_libc():
+  """Return the C library if it has inotify, or None."""
+  name = ctypes.util.find_library("c")
+  if not name:
+    return None
+  try:
+    libc = ctypes.CDLL(name, use_errno=True)
+    libc.inotify_init  # pylint: disable=pointless-statement
+    libc.inotify_add_watch  # pylint: disable=pointless-statement
+  except (OSError, AttributeError):
+    return None
+  return libc
+
+
+def watcher_for(filenames):
+  """Return the best available watcher for some files.
+
+  Args:
+    filenames: ([str, ...]) the files to watch.
+  Returns:
+    (InotifyWatcher or PollingWatcher): the watcher.
+  """
+  libc = _inotify_libc()
+  if libc is not None:
+    try:
+      return InotifyWatcher(filenames, libc)
+    except OSError, ex:
+      print "Can't use inotify (%s); polling instead." % ex
+  return PollingWatcher(filenames)
+
+
+def wait_for_changes(watcher, debounce=DEBOUNCE_SECONDS):
+  """Wait for files to change, then until they've stopped changing.
+
+  Args:
+    watcher: (InotifyWatcher or PollingWatcher) what to wait on.
+    debounce: (float) how many quiet seconds mean the files have settled.
+  Returns:
+    (set): the files that changed.
+  """
+  changed = watcher.changed()
+  while True:
+    more = watcher.changed(timeout=debounce)
+    if not more:
+      return changed
+    changed |= more
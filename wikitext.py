@@ -0,0 +1,360 @@
+#!/usr/bin/python2.7
+
+"""Just enough of a wikitext parser to read the tables on a wikipedia
+Elections page: {| ... |} tables, [[links]], a few formatting templates and
+<ref> citations.
+
+Reading a page's wikitext rather than its rendered html means a much smaller
+download, and no html parser.
+"""
+
+import re
+
+# Rendered cells point at citations with markers like [3], like rendered
+# pages do. While rendering, each <ref> is a placeholder with its number.
+_MARKER = u"\x00%d\x00"
+_MARKER_RE = re.compile(u"\x00(\\d+)\x00")
+
+_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+# <ref name="x" />, or <ref name="x">citation</ref>
+_REF_RE = re.compile(r"<ref(\s[^>]*?)?(?:/>|>(.*?)</ref\s*>)",
+                     re.DOTALL | re.IGNORECASE)
+_REF_NAME_RE = re.compile(
+    r"""name\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'/>]+))""", re.IGNORECASE)
+_LINK_RE = re.compile(r"\[\[([^\[\]]*)\]\]")
+_TEMPLATE_RE = re.compile(r"\{\{([^{}]*)\}\}")
+_EXTERNAL_LINK_RE = re.compile(r"\[((?:https?:)?//[^\s\]]+)(?:\s+([^\]]*))?\]")
+_BREAK_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_TAG_RE = re.compile(r"</?[a-zA-Z][^>]*>")
+_BOLD_ITALIC_RE = re.compile(r"'{2,}")
+_BULLET_RE = re.compile(r"^[*#:;]+\s*", re.MULTILINE)
+_CLASS_RE = re.compile(r"""class\s*=\s*(?:"([^"]*)"|'([^']*)'|(\S+))""")
+_CITE_RE = re.compile(r"^(cite \w+|citation)$")
+# Link namespaces that don't render as text.
+_HIDDEN_LINKS = ["file:", "image:", "category:"]
+
+
+class Cell(object):
+  """A rendered table cell."""
+
+  def __init__(self, text, notes):
+    """
+    Args:
+      text: (unicode) The cell as plain text, as a browser would show it.
+      notes: ({unicode: str, ...}) The citation markers in the cell, e.g.,
+             [63], to the ids of the citations they refer to.
+    """
+    self.text = text
+    self.notes = notes
+
+
+def split_top_level(text, separator, maxsplit=-1):
+  """Split text on a separator, except inside [[links]] and {{templates}}.
+
+  Args:
+    text: (unicode) wikitext.
+    separator: (str) what to split on, e.g., "|".
+    maxsplit: (int) split at most this many times; -1 for no limit.
+  Returns:
+    ([unicode, ...]): the pieces.
+  """
+  parts = []
+  depth = 0
+  start = 0
+  i = 0
+  while i < len(text):
+    pair = text[i:i + 2]
+    if pair == "{{" or pair == "[[":
+      depth += 1
+      i += 2
+    elif (pair == "}}" or pair == "]]") and depth:
+      depth -= 1
+      i += 2
+    elif (depth == 0 and text.startswith(separator, i) and
+          (maxsplit < 0 or len(parts) < maxsplit)):
+      parts.append(text[start:i])
+      i += len(separator)
+      start = i
+    else:
+      i += 1
+  parts.append(text[start:])
+  return parts
+
+
+def parse_template(inside):
+  """Split the inside of a {{template}} into its name and arguments.
+
+  Args:
+    inside: (unicode) what's between the braces.
+  Returns:
+    (unicode, [unicode, ...], {unicode: unicode, ...}): the lowercased
+      name, positional arguments and named arguments.
+  """
+  parts = split_top_level(inside, "|")
+  name = " ".join(parts[0].replace("_", " ").split()).lower()
+  positional = []
+  named = {}
+  for part in parts[1:]:
+    key, equals, value = part.partition("=")
+    if equals and re.match(r"^\s*[\w -]+\s*$", key):
+      named[key.strip()] = value.strip()
+    else:
+      positional.append(part.strip())
+  return name, positional, named
+
+
+def _ushr(args):
+  """{{ushr|Alabama|2|X}} is Alabama's 2nd district; AL is at-large."""
+  if len(args) < 2:
+    return " ".join(args)
+  district = "at-large" if args[1].upper() == "AL" else args[1]
+  return u"%s %s" % (args[0], district)
+
+
+def _sortname(args):
+  """{{sortname|First|Last}} is "First Last"."""
+  return u" ".join(args[:2])
+
+
+def _last(args):
+  """{{sort|key|text}} shows the text, or the key if that's all there is."""
+  return args[-1] if args else u""
+
+
+def _first(args):
+  """{{nowrap|text}} and friends show just their text."""
+  return args[0] if args else u""
+
+
+def _lines(args):
+  """{{unbulleted list|a|b}} shows one line for each argument."""
+  return u"\n".join(args)
+
+
+# How to render the templates that turn up in Elections tables. Others
+# (shading, footnotes, flags) render as nothing.
+TEMPLATES = {
+  "ushr": _ushr,
+  "sortname": _sortname,
+  "sort": _last,
+  "nowrap": _first,
+  "nobr": _first,
+  "small": _first,
+  "plainlist": _first,
+  "flatlist": _first,
+  "unbulleted list": _lines,
+  "ubl": _lines,
+}
+
+
+def _render_link(match):
+  """[[Target|Label]] shows Label; [[Target]] shows Target."""
+  target, _, label = match.group(1).partition("|")
+  if target.strip().lower().startswith(tuple(_HIDDEN_LINKS)):
+    return u""
+  return label or target
+
+
+def _render_template(match):
+  """Render a template with no templates inside it."""
+  name, positional, _ = parse_template(match.group(1))
+  renderer = TEMPLATES.get(name)
+  return renderer(positional) if renderer else u""
+
+
+def render(text):
+  """Turn a bit of wikitext into the plain text a reader would see.
+
+  Args:
+    text: (unicode) wikitext, with refs already replaced by placeholders.
+  Returns:
+    (unicode): the text.
+  """
+  from HTMLParser import HTMLParser
+
+  text = _LINK_RE.sub(_render_link, text)
+  # Innermost templates first, so arguments are plain text by the time the
+  # template around them is rendered.
+  while True:
+    text, count = _TEMPLATE_RE.subn(_render_template, text)
+    if not count:
+      break
+  text = _EXTERNAL_LINK_RE.sub(lambda match: match.group(2) or u"", text)
+  text = _BREAK_RE.sub(u"\n", text)
+  text = _TAG_RE.sub(u"", text)
+  text = _BOLD_ITALIC_RE.sub(u"", text)
+  text = _BULLET_RE.sub(u"", text)
+  return HTMLParser().unescape(text).strip()
+
+
+def _citation(body):
+  """Find the title and url in a <ref>'s contents.
+
+  Understands {{cite news}}-style templates, whose titles are shown in quotes
+  (except books'), and [url title] links.
+
+  Args:
+    body: (unicode) what's inside the <ref>.
+  Returns:
+    ((unicode, unicode)): the title and url, or None if there aren't any.
+  """
+  body = _LINK_RE.sub(_render_link, body)
+  start = body.find("{{")
+  while start >= 0:
+    parts = split_top_level(body[start + 2:], "}}", 1)
+    name, _, named = parse_template(parts[0])
+    if _CITE_RE.match(name) and named.get("url") and named.get("title"):
+      title = render(named["title"])
+      if name != "cite book":
+        title = u'"%s"' % title
+      return title, named["url"]
+    start = body.find("{{", start + 2)
+  match = _EXTERNAL_LINK_RE.search(body)
+  if match and match.group(2):
+    return render(match.group(2)), match.group(1)
+  return None
+
+
+def extract_refs(text):
+  """Pull the <ref>s out of some wikitext.
+
+  Args:
+    text: (unicode) wikitext.
+  Returns:
+    (unicode, [str, ...], {str: (unicode, unicode), ...}): the text with
+      each ref replaced by a placeholder for render; the citation id for
+      each placeholder number; and the title and url of each citation we
+      could make sense of, by id.
+  """
+  ids = {}  # citation id to placeholder number
+  order = []
+  citations = {}
+
+  def replace(match):
+    """Swap a ref for a placeholder, noting its citation."""
+    attributes, body = match.group(1) or "", match.group(2)
+    name = _REF_NAME_RE.search(attributes)
+    if name:
+      # Ref names can't be numbers, so these can't clash.
+      note = u"cite_note-%s" % (
+          name.group(1) or name.group(2) or name.group(3))
+    else:
+      note = u"cite_note-%d" % len(order)
+    if note not in ids:
+      ids[note] = len(order)
+      order.append(note)
+    if body is not None and note not in citations:
+      citation = _citation(body)
+      if citation:
+        citations[note] = citation
+    return _MARKER % (ids[note] + 1)
+
+  return _REF_RE.sub(replace, text), order, citations
+
+
+def _cell(source, order):
+  """Render a table cell, dropping any attributes before its content."""
+  parts = split_top_level(source, "|", 1)
+  text = render(parts[-1])
+  notes = {}
+  for number in _MARKER_RE.findall(text):
+    notes.setdefault(u"[%s]" % number, order[int(number) - 1])
+  return Cell(_MARKER_RE.sub(r"[\1]", text), notes)
+
+
+def _split_cells(line, separators):
+  """Split a table line (without its leading | or !) into cells."""
+  cells = [line]
+  for separator in separators:
+    cells = [cell for part in cells
+             for cell in split_top_level(part, separator)]
+  return cells
+
+
+def _table_rows(lines, order):
+  """Read the rows of a table.
+
+  Args:
+    lines: ([unicode, ...]) the table's lines, between {| and |}.
+    order: ([str, ...]) from extract_refs.
+  Returns:
+    ([(unicode, [Cell, ...], [Cell, ...]), ...]): each row's wikitext, its
+      header cells and its data cells.
+  """
+  rows = []
+  cells = []  # ("th" or "td", wikitext)
+  source = []
+  depth = 0  # of tables inside cells, which stay part of their cell
+
+  def finish():
+    """Render the row so far."""
+    if cells:
+      headers = [_cell(text, order) for kind, text in cells if kind == "th"]
+      columns = [_cell(text, order) for kind, text in cells if kind == "td"]
+      rows.append((u"\n".join(source), headers, columns))
+
+  for line in lines:
+    stripped = line.strip()
+    if depth:
+      depth += stripped.startswith("{|") - stripped.startswith("|}")
+      cells[-1] = (cells[-1][0], cells[-1][1] + u"\n" + line)
+    elif stripped.startswith("|-"):
+      finish()
+      cells = []
+      source = []
+      continue
+    elif stripped.startswith("|+"):
+      continue  # A caption.
+    elif stripped.startswith("{|") and cells:
+      depth = 1
+      cells[-1] = (cells[-1][0], cells[-1][1] + u"\n" + line)
+    elif stripped.startswith("!"):
+      cells.extend(("th", cell) for cell in
+                   _split_cells(stripped[1:], ["!!", "||"]))
+    elif stripped.startswith("|"):
+      cells.extend(("td", cell) for cell in
+                   _split_cells(stripped[1:], ["||"]))
+    elif cells:
+      cells[-1] = (cells[-1][0], cells[-1][1] + u"\n" + line)
+    source.append(line)
+  finish()
+  return rows
+
+
+def tables(text, table_class=None):
+  """Find the tables in a page's wikitext.
+
+  Args:
+    text: (unicode) a page's wikitext.
+    table_class: (str) only return tables with exactly this class, e.g.,
+                 "wikitable sortable"; None for all of them.
+  Returns:
+    ([[(unicode, [Cell, ...], [Cell, ...]), ...], ...],
+     {str: (unicode, unicode), ...}): the rows of each table, as from
+      _table_rows, and the title and url of each citation on the page, by id.
+  """
+  text, order, citations = extract_refs(_COMMENT_RE.sub(u"", text))
+  found = []
+  lines = text.split("\n")
+  i = 0
+  while i < len(lines):
+    stripped = lines[i].strip()
+    if not stripped.startswith("{|"):
+      i += 1
+      continue
+    match = _CLASS_RE.search(stripped)
+    classes = ""
+    if match:
+      classes = " ".join(
+          (match.group(1) or match.group(2) or match.group(3)).split())
+    # Find the matching |}, skipping over any tables inside this one.
+    depth = 1
+    end = i + 1
+    while end < len(lines) and depth:
+      inner = lines[end].strip()
+      depth += inner.startswith("{|") - inner.startswith("|}")
+      end += 1
+    if table_class is None or classes == table_class:
+      found.append(_table_rows(lines[i + 1:end - 1], order))
+    i = end
+  return found, citations